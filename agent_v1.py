@@ -1,48 +1,163 @@
+import hashlib
 import sys
 import time
-import requests
 import json
 import os
+import random
+import threading
 
-try:
-    import pynvml
-    pynvml.nvmlInit()
-    NVML_AVAILABLE = True
-except ImportError:
-    NVML_AVAILABLE = False
+# requests, asyncio and pynvml are imported on first use, so quick commands such
+# as `status` and `validate-config` start without loading them.
+pynvml = None
+NVML_AVAILABLE = None  # unknown until the first GPU query, see _nvml_available()
+
+def _nvml_available():
+    """Import and initialize NVML once, on the first GPU query."""
+    global pynvml, NVML_AVAILABLE
+    if NVML_AVAILABLE is None:
+        try:
+            import pynvml as nvml
+            nvml.nvmlInit()
+            pynvml = nvml
+            NVML_AVAILABLE = True
+        except ImportError:
+            NVML_AVAILABLE = False
+    return NVML_AVAILABLE
 
 # IMPORTANT: BACKEND_URL should use the URL where your backend API is hosted. Our backend URL isn't public yet. On release, the files included in our AgentV1 will be updated to the correct URL to interact with our protocol.
 BACKEND_URL = "http://127.0.0.1:8000"
 
 CONFIG_FILE = "agent_config.json"
 
-def get_gpus():
-    gpus = []
-    if NVML_AVAILABLE:
-        count = pynvml.nvmlDeviceGetCount()
-        for i in range(count):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            name = pynvml.nvmlDeviceGetName(handle)
-            if isinstance(name, bytes):
-                name = name.decode()
-            mem = pynvml.nvmlDeviceGetMemoryInfo(handle).total // (1024 ** 3)
+ALLOWED_BUNDLED_RAM_SIZES = [100, 200, 500]
+
+# Telemetry: sample the selected GPUs every TELEMETRY_SAMPLE_INTERVAL seconds and
+# upload a delta-encoded batch every TELEMETRY_SEND_INTERVAL seconds.
+TELEMETRY_SAMPLE_INTERVAL = float(os.environ.get("LLMVERSE_TELEMETRY_SAMPLE_INTERVAL", "5"))
+TELEMETRY_SEND_INTERVAL = float(os.environ.get("LLMVERSE_TELEMETRY_INTERVAL", "60"))
+
+def _nvml_value(fn, *args):
+    try:
+        return fn(*args)
+    except Exception:
+        return None
+
+class GPUInventory:
+    """
+    GPU inventory backed by NVML. Static properties (handle, name, total memory,
+    memory clock) are resolved once; dynamic metrics are refreshed by a background
+    sampler and served from a cached snapshot, falling back to a synchronous
+    refresh when the snapshot is older than `ttl` seconds.
+    """
+
+    def __init__(self, sample_interval=5.0, ttl=10.0):
+        self.sample_interval = sample_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._gpus = None
+        self._handles = {}
+        self._metrics = {}  # index -> [util, mem_used_mb, sm_clock_mhz, mem_clock_mhz]
+        self._sampled_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def gpus(self):
+        if self._gpus is None:
+            with self._lock:
+                if self._gpus is None:
+                    self._gpus = self._discover()
+        return [dict(gpu) for gpu in self._gpus]
+
+    def _discover(self):
+        gpus = []
+        if _nvml_available():
+            count = pynvml.nvmlDeviceGetCount()
+            for i in range(count):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+                self._handles[i] = handle
+                name = pynvml.nvmlDeviceGetName(handle)
+                if isinstance(name, bytes):
+                    name = name.decode()
+                mem = pynvml.nvmlDeviceGetMemoryInfo(handle).total // (1024 ** 3)
+                try:
+                    freq = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM)
+                except:
+                    freq = "N/A"
+                gpu = {
+                    "index": i,
+                    "name": name,
+                    "memory_gb": mem,
+                    "frequency": freq
+                }
+                gpu_uuid = _nvml_value(pynvml.nvmlDeviceGetUUID, handle)
+                if gpu_uuid is not None:
+                    gpu["uuid"] = gpu_uuid.decode() if isinstance(gpu_uuid, bytes) else gpu_uuid
+                gpus.append(gpu)
+        else:
+            # Mock data if NVML not available
+            gpus = [
+                {"index": 0, "name": "NVIDIA RTX 3080", "memory_gb": 10, "frequency": 9500},
+                {"index": 1, "name": "NVIDIA GTX 1660", "memory_gb": 6, "frequency": 8000}
+            ]
+        return gpus
+
+    def refresh(self):
+        """Sample every GPU once and replace the cached snapshot."""
+        gpus = self.gpus()
+        metrics = {}
+        if _nvml_available():
+            for gpu in gpus:
+                handle = self._handles[gpu["index"]]
+                util = _nvml_value(pynvml.nvmlDeviceGetUtilizationRates, handle)
+                mem = _nvml_value(pynvml.nvmlDeviceGetMemoryInfo, handle)
+                sm_clock = _nvml_value(pynvml.nvmlDeviceGetClockInfo, handle, pynvml.NVML_CLOCK_SM)
+                mem_clock = _nvml_value(pynvml.nvmlDeviceGetClockInfo, handle, pynvml.NVML_CLOCK_MEM)
+                metrics[gpu["index"]] = [
+                    util.gpu if util is not None else 0,
+                    mem.used // (1024 ** 2) if mem is not None else 0,
+                    sm_clock or 0,
+                    mem_clock or 0
+                ]
+        else:
+            # Mock data: idle GPUs running at their listed frequency
+            for gpu in gpus:
+                metrics[gpu["index"]] = [0, 0, 0, int(gpu["frequency"])]
+        self._metrics = metrics
+        self._sampled_at = time.monotonic()
+        return metrics
+
+    def metrics(self, indices=None):
+        """Return {index: [util, mem_used_mb, sm_clock_mhz, mem_clock_mhz]} from the cached snapshot."""
+        metrics = self._metrics
+        if time.monotonic() - self._sampled_at > self.ttl:
+            metrics = self.refresh()
+        if indices is None:
+            return dict(metrics)
+        return {i: metrics[i] for i in indices if i in metrics}
+
+    def start(self):
+        """Start the background sampler (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gpu-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
             try:
-                freq = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM)
-            except:
-                freq = "N/A"
-            gpus.append({
-                "index": i,
-                "name": name,
-                "memory_gb": mem,
-                "frequency": freq
-            })
-    else:
-        # Mock data if NVML not available
-        gpus = [
-            {"index": 0, "name": "NVIDIA RTX 3080", "memory_gb": 10, "frequency": 9500},
-            {"index": 1, "name": "NVIDIA GTX 1660", "memory_gb": 6, "frequency": 8000}
-        ]
-    return gpus
+                self.refresh()
+            except Exception as e:
+                print(f"GPU sampling failed: {e}")
+            self._stop.wait(self.sample_interval)
+
+INVENTORY = GPUInventory(sample_interval=TELEMETRY_SAMPLE_INTERVAL, ttl=2 * TELEMETRY_SAMPLE_INTERVAL)
+
+def get_gpus():
+    return INVENTORY.gpus()
 
 def print_status(gpus, wallet, cpp_id, selected_gpus, gpu_percents):
     print("="*44)
@@ -64,69 +179,363 @@ def print_status(gpus, wallet, cpp_id, selected_gpus, gpu_percents):
     print(f"  {cpp_id if cpp_id else '(none)'}")
     print("-"*44)
 
-def save_config(wallet, selected_gpus, gpu_percents, cpp_id):
-    config = {
-        "wallet": wallet,
-        "selected_gpus": selected_gpus,
-        "gpu_percents": gpu_percents,
-        "cpp_id": cpp_id
-    }
-    with open(CONFIG_FILE, "w") as f:
+def _read_config(path=None):
+    """Raw contents of the config file, {} when it is missing or unreadable."""
+    path = path or CONFIG_FILE
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            try:
+                return json.load(f)
+            except Exception:
+                pass
+    return {}
+
+def _update_config(path=None, **fields):
+    """Merge fields into the config file, keeping the keys it already has."""
+    config = _read_config(path)
+    config.update(fields)
+    with open(path or CONFIG_FILE, "w") as f:
         json.dump(config, f)
 
+def save_config(wallet, selected_gpus, gpu_percents, cpp_id, node_id=None):
+    _update_config(
+        wallet=wallet,
+        selected_gpus=selected_gpus,
+        gpu_percents=gpu_percents,
+        cpp_id=cpp_id,
+        node_id=node_id
+    )
+
 def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
+    config = _read_config()
+    try:
+        return (
+            config.get("wallet"),
+            config.get("selected_gpus", []),
+            {int(k): v for k, v in config.get("gpu_percents", {}).items()},
+            config.get("cpp_id"),
+            config.get("node_id")
+        )
+    except Exception:
+        return None, [], {}, None, None
+
+# Backend HTTP client: one keep-alive connection pool per process, a timeout on
+# every call and jittered exponential backoff between retries.
+HTTP_TIMEOUT = (3.05, 15)  # (connect, read) seconds
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 30.0
+# The backend did not act on these, so any request can be repeated
+RETRY_STATUSES = {429, 503}
+# The request may already have been applied; only idempotent calls repeat on these
+IDEMPOTENT_RETRY_STATUSES = {500, 502, 504}
+
+def _backoff(attempt):
+    # Full jitter: a fleet reconnecting after an outage spreads its retries out
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+def _never_sent(exc):
+    import requests
+    import urllib3
+    # Connect timeouts and refused connections fail before any request bytes go out
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+def _should_retry(status_code, idempotent):
+    return status_code in RETRY_STATUSES or (idempotent and status_code in IDEMPOTENT_RETRY_STATUSES)
+
+class BackendClient:
+    """
+    Pooled, retrying client for the backend API.
+    Non-idempotent calls (the default) are only retried when the request cannot
+    have reached the backend: connect errors and 429/503 responses. Idempotent
+    calls are also retried on read timeouts, dropped connections and 5xx gateway errors.
+    """
+
+    def __init__(self, base_url=None, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES, pool_size=16):
+        import requests
+        import requests.adapters
+        self._requests = requests
+        self.base_url = base_url or BACKEND_URL
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, payload, idempotent=False):
+        requests = self._requests
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
             try:
-                config = json.load(f)
-                return (
-                    config.get("wallet"),
-                    config.get("selected_gpus", []),
-                    {int(k): v for k, v in config.get("gpu_percents", {}).items()},
-                    config.get("cpp_id")
-                )
-            except Exception:
-                pass
-    return None, [], {}, None
+                resp = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt or not (idempotent or _never_sent(e)):
+                    raise
+            else:
+                if last_attempt or not _should_retry(resp.status_code, idempotent):
+                    resp.raise_for_status()
+                    return resp.json()
+            time.sleep(_backoff(attempt))
+
+    def close(self):
+        self.session.close()
+
+class AsyncBackendClient:
+    """
+    asyncio counterpart of BackendClient (same retry rules) for controllers that
+    drive many agent registrations concurrently. Needs the optional `httpx` package.
+    """
+
+    def __init__(self, base_url=None, timeout=HTTP_TIMEOUT, max_retries=HTTP_MAX_RETRIES, pool_size=100):
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError("AsyncBackendClient requires httpx (python -m pip install httpx)")
+        self._httpx = httpx
+        self.base_url = base_url or BACKEND_URL
+        self.max_retries = max_retries
+        connect, read = timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def post(self, path, payload, idempotent=False):
+        import asyncio
+        httpx = self._httpx
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                resp = await self.client.post(f"{self.base_url}{path}", json=payload)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if last_attempt:
+                    raise
+            except httpx.TransportError:
+                if last_attempt or not idempotent:
+                    raise
+            else:
+                if last_attempt or not _should_retry(resp.status_code, idempotent):
+                    resp.raise_for_status()
+                    return resp.json()
+            await asyncio.sleep(_backoff(attempt))
+
+    async def register_agent(self, wallet, gpus, gpu_percents, node_id=None):
+        resp = await self.post("/register_agent", _register_payload(wallet, gpus, gpu_percents, node_id))
+        return resp["node_id"]
+
+    async def create_cpp(self, node_id, gpus, gpu_percents, cpp_type="isolated", target_ram=None):
+        return await self.post("/create_cpp", _cpp_payload(node_id, gpus, gpu_percents, cpp_type, target_ram))
 
-def register_agent(wallet, gpus, gpu_percents):
+    async def aclose(self):
+        await self.client.aclose()
+
+_client = None
+
+def get_client():
+    """Process-wide BackendClient, created on first use."""
+    global _client
+    if _client is None:
+        _client = BackendClient()
+    return _client
+
+def _gpu_payload(gpus, gpu_percents):
+    payload = []
+    for gpu in gpus:
+        if gpu["index"] not in gpu_percents:
+            continue
+        item = {
+            "index": gpu["index"],
+            "name": gpu["name"],
+            "memory_gb": gpu["memory_gb"],
+            "frequency": str(gpu["frequency"]),
+            "percent": gpu_percents[gpu["index"]]
+        }
+        if gpu.get("uuid"):
+            item["uuid"] = gpu["uuid"]
+        payload.append(item)
+    return payload
+
+MACHINE_ID_FILES = ("/etc/machine-id", "/var/lib/dbus/machine-id")
+
+def _machine_id():
+    """
+    Hashed OS machine id, so the backend can tell apart fleet hosts with the same
+    wallet and hardware. None where the OS has none (the backend then relies on
+    the saved node_id and GPU UUIDs).
+    """
+    for path in MACHINE_ID_FILES:
+        try:
+            with open(path, "r") as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        if raw:
+            # The raw id is meant to stay on the host; send an app-specific hash of it
+            return hashlib.sha256(("llmverse:" + raw).encode()).hexdigest()
+    return None
+
+def _register_payload(wallet, gpus, gpu_percents, node_id=None):
     payload = {
         "wallet": wallet,
-        "gpus": [
-            {
-                "index": gpu["index"],
-                "name": gpu["name"],
-                "memory_gb": gpu["memory_gb"],
-                "frequency": str(gpu["frequency"]),
-                "percent": gpu_percents[gpu["index"]]
-            }
-            for gpu in gpus if gpu["index"] in gpu_percents
-        ]
+        "gpus": _gpu_payload(gpus, gpu_percents)
     }
-    resp = requests.post(f"{BACKEND_URL}/register_agent", json=payload)
-    resp.raise_for_status()
-    return resp.json()["node_id"]
+    machine_id = _machine_id()
+    if machine_id:
+        payload["machine_id"] = machine_id
+    if node_id:
+        # Lets the backend update this node in place instead of registering a new one
+        payload["node_id"] = node_id
+    return payload
 
-def create_cpp(node_id, gpus, gpu_percents, cpp_type="isolated", target_ram=None):
+def _cpp_payload(node_id, gpus, gpu_percents, cpp_type="isolated", target_ram=None):
     payload = {
         "node_id": node_id,
-        "gpus": [
-            {
-                "index": gpu["index"],
-                "name": gpu["name"],
-                "memory_gb": gpu["memory_gb"],
-                "frequency": str(gpu["frequency"]),
-                "percent": gpu_percents[gpu["index"]]
-            }
-            for gpu in gpus if gpu["index"] in gpu_percents
-        ],
+        "gpus": _gpu_payload(gpus, gpu_percents),
         "cpp_type": cpp_type
     }
     if cpp_type == "bundled" and target_ram:
         payload["target_ram"] = target_ram
-    resp = requests.post(f"{BACKEND_URL}/create_cpp", json=payload)
-    resp.raise_for_status()
-    return resp.json()
+    return payload
+
+def register_agent(wallet, gpus, gpu_percents, node_id=None):
+    return get_client().post("/register_agent", _register_payload(wallet, gpus, gpu_percents, node_id))["node_id"]
+
+def create_cpp(node_id, gpus, gpu_percents, cpp_type="isolated", target_ram=None):
+    return get_client().post("/create_cpp", _cpp_payload(node_id, gpus, gpu_percents, cpp_type, target_ram))
+
+def sample_gpus(indices):
+    """Return {index: [util, mem_used_mb, sm_clock_mhz, mem_clock_mhz]} for the given GPUs."""
+    return INVENTORY.metrics(indices)
+
+def delta_encode(batch):
+    """
+    Turn [(t_ms, {index: values}), ...] into one series per GPU: the first sample
+    is sent as-is ("base") and every later one as differences from the sample before it.
+    """
+    series = {}
+    last = {}
+    for t_ms, samples in batch:
+        for idx, values in samples.items():
+            row = [t_ms] + list(values)
+            if idx not in series:
+                series[idx] = {"index": idx, "base": row, "deltas": []}
+            else:
+                series[idx]["deltas"].append([a - b for a, b in zip(row, last[idx])])
+            last[idx] = row
+    return list(series.values())
+
+def send_telemetry(node_id, batch):
+    payload = {"node_id": node_id, "gpus": delta_encode(batch)}
+    return get_client().post("/telemetry", payload)
+
+# "auto" power: dedicate to the CPP what the host's own workloads leave free.
+AUTO_MIN_PERCENT = 10
+AUTO_MAX_PERCENT = 100
+AUTO_HEADROOM = 10            # points kept free on top of the host's load
+AUTO_HYSTERESIS = 5           # target moves smaller than this are ignored
+AUTO_MAX_STEP = 10            # most the percent moves per sample
+AUTO_REPORT_THRESHOLD = 10    # report once the percent is this far from the last report
+AUTO_REPORT_MIN_INTERVAL = 60.0
+AUTO_SMOOTHING = 0.3          # EWMA weight of the newest load sample
+
+class AutoPowerController:
+    """
+    Effective CPP percent of the GPUs set to "auto". A GPU's host load is the larger
+    of its utilization and memory pressure, smoothed with an EWMA; the target is
+    what is left after AUTO_HEADROOM. The percent follows the target with
+    hysteresis and at most AUTO_MAX_STEP points per sample, and is reported to the
+    backend only after moving AUTO_REPORT_THRESHOLD points, at most once per
+    AUTO_REPORT_MIN_INTERVAL seconds.
+    """
+
+    def __init__(self, memory_gb):
+        self.memory_mb = {idx: gb * 1024 for idx, gb in memory_gb.items()}  # auto GPUs only
+        self.load = {}
+        self.percent = {}
+        self.reported = {}
+        self.reported_at = None
+
+    def update(self, metrics):
+        """Feed one sample, {index: [util, mem_used_mb, sm_clock_mhz, mem_clock_mhz]}."""
+        for idx, memory_mb in self.memory_mb.items():
+            values = metrics.get(idx)
+            if values is None:
+                continue
+            util, mem_used_mb = values[0], values[1]
+            host = max(util, 100 * mem_used_mb / memory_mb if memory_mb else 0)
+            load = self.load.get(idx)
+            load = host if load is None else load + AUTO_SMOOTHING * (host - load)
+            self.load[idx] = load
+            target = int(round(min(AUTO_MAX_PERCENT, max(AUTO_MIN_PERCENT, 100 - load - AUTO_HEADROOM))))
+            current = self.percent.get(idx)
+            if current is None:
+                self.percent[idx] = target
+            elif abs(target - current) >= AUTO_HYSTERESIS:
+                self.percent[idx] = current + max(-AUTO_MAX_STEP, min(AUTO_MAX_STEP, target - current))
+
+    def due_report(self, now):
+        """{index: percent} to send to the backend now, or None."""
+        if not self.percent:
+            return None
+        if self.reported_at is not None and now - self.reported_at < AUTO_REPORT_MIN_INTERVAL:
+            return None
+        moved = any(
+            idx not in self.reported or abs(percent - self.reported[idx]) >= AUTO_REPORT_THRESHOLD
+            for idx, percent in self.percent.items()
+        )
+        return dict(self.percent) if moved else None
+
+    def acknowledge(self, report, now):
+        self.reported = dict(report)
+        self.reported_at = now
+
+def send_power(node_id, percents):
+    payload = {"node_id": node_id, "gpus": {str(idx): percent for idx, percent in percents.items()}}
+    return get_client().post("/power", payload, idempotent=True)
+
+def run_telemetry(node_id, gpu_indices, stop=None, gpu_percents=None):
+    """
+    Sample and upload telemetry until interrupted or `stop` is set. A failed upload
+    drops its batch. Returns early when the backend no longer has the node in a
+    pool (it was expired or the backend was reset), so the caller can reconnect.
+    GPUs whose percent is "auto" in `gpu_percents` get their effective percent
+    from an AutoPowerController fed with the same samples.
+    """
+    stop = stop or threading.Event()
+    INVENTORY.start()
+    auto = {idx for idx in gpu_indices if (gpu_percents or {}).get(idx) == "auto"}
+    controller = None
+    if auto:
+        controller = AutoPowerController({gpu["index"]: gpu["memory_gb"] for gpu in get_gpus() if gpu["index"] in auto})
+    batch = []
+    next_send = time.time() + TELEMETRY_SEND_INTERVAL
+    while not stop.is_set():
+        samples = sample_gpus(gpu_indices)
+        batch.append((int(time.time() * 1000), samples))
+        if controller is not None:
+            controller.update(samples)
+            report = controller.due_report(time.time())
+            if report is not None:
+                try:
+                    send_power(node_id, report)
+                    controller.acknowledge(report, time.time())
+                except Exception as e:
+                    print(f"Power report failed: {e}")
+        if time.time() >= next_send:
+            try:
+                if send_telemetry(node_id, batch).get("connected") is False:
+                    return
+            except Exception as e:
+                if getattr(getattr(e, "response", None), "status_code", None) == 404:
+                    return
+                print(f"Telemetry upload failed: {e}")
+            batch = []
+            next_send = time.time() + TELEMETRY_SEND_INTERVAL
+        stop.wait(TELEMETRY_SAMPLE_INTERVAL)
 
 def settings_menu(gpus, wallet, selected_gpus, gpu_percents):
     while True:
@@ -211,13 +620,10 @@ def settings_menu(gpus, wallet, selected_gpus, gpu_percents):
 
 def main():
     gpus = get_gpus()
-    wallet, selected_gpus, gpu_percents, cpp_id = load_config()
-    node_id = None
+    wallet, selected_gpus, gpu_percents, cpp_id, node_id = load_config()
     cpp_type = "isolated"
     target_ram = None
 
-    ALLOWED_BUNDLED_RAM_SIZES = [100, 200, 500]
-
     while True:
         print_status(gpus, wallet, cpp_id, selected_gpus, gpu_percents)
         print("Options:")
@@ -231,7 +637,7 @@ def main():
         choice = input("Select an option: ").strip()
         if choice == "1":
             wallet, selected_gpus, gpu_percents = settings_menu(gpus, wallet, selected_gpus, gpu_percents)
-            save_config(wallet, selected_gpus, gpu_percents, cpp_id)
+            save_config(wallet, selected_gpus, gpu_percents, cpp_id, node_id)
         elif choice == "2":
             if not wallet or wallet.strip() == "":
                 print("\nWARNING: You must set your Solana wallet payout address in Settings before updating CPP settings.")
@@ -265,7 +671,7 @@ def main():
             confirm = input("Confirm connection and register with backend? (y/n): ").strip().lower()
             if confirm == "y":
                 try:
-                    node_id = register_agent(wallet, [g for g in gpus if g["index"] in selected_gpus], gpu_percents)
+                    node_id = register_agent(wallet, [g for g in gpus if g["index"] in selected_gpus], gpu_percents, node_id)
                     cpp_resp = create_cpp(node_id, [g for g in gpus if g["index"] in selected_gpus], gpu_percents, cpp_type, target_ram)
                     # Confirmation message after backend response
                     print("\nBackend has received your CPP update.")
@@ -278,7 +684,7 @@ def main():
                         print(f"Pool status: {cpp_resp['total_ram']}GB / {cpp_resp['target_ram']}GB")
                         if cpp_resp.get("is_full"):
                             print("Bundled pool is now FULL and available for jobs!")
-                    save_config(wallet, selected_gpus, gpu_percents, cpp_id)
+                    save_config(wallet, selected_gpus, gpu_percents, cpp_id, node_id)
                     # Always display current CPP ID after update
                     print(f"Current CPP ID: {cpp_id}")
                 except Exception as e:
@@ -288,11 +694,12 @@ def main():
                 print("You can track real-time usage and earnings in the dashboard (coming soon).")
                 print("Press Ctrl+C to exit the agent.")
                 try:
-                    while True:
-                        time.sleep(60)
+                    run_telemetry(node_id, selected_gpus, gpu_percents=gpu_percents)
                 except KeyboardInterrupt:
                     print("\nExiting agent.")
                     sys.exit(0)
+                print("\nThe backend dropped this node (offline too long, or the backend was reset).")
+                print("Use Update CPP Settings to connect again.")
             else:
                 print("Cancelled.")
         elif choice == "3":
@@ -327,7 +734,7 @@ def main():
         elif choice == "4":
             selected_gpus = []
             gpu_percents = {}
-            save_config(wallet, selected_gpus, gpu_percents, cpp_id)
+            save_config(wallet, selected_gpus, gpu_percents, cpp_id, node_id)
             print("All GPUs removed from pool.")
         elif choice == "5":
             print("Goodbye.")
@@ -335,5 +742,185 @@ def main():
         else:
             print("Invalid option.")
 
+# Headless mode: `python agent_v1.py run|status|validate-config`. Settings come from
+# command-line flags, then LLMVERSE_* environment variables, then agent_config.json.
+SETTINGS_ENV = {
+    "wallet": "LLMVERSE_WALLET",
+    "gpus": "LLMVERSE_GPUS",
+    "percent": "LLMVERSE_GPU_PERCENTS",
+    "cpp_type": "LLMVERSE_CPP_TYPE",
+    "target_ram": "LLMVERSE_TARGET_RAM",
+    "backend_url": "LLMVERSE_BACKEND_URL",
+}
+
+def _parse_gpus(value):
+    if isinstance(value, list):
+        return [int(i) for i in value]
+    return [int(i) for i in str(value).split(",") if i.strip()]
+
+def _parse_percent(value):
+    value = str(value).strip().lower()
+    return value if value == "auto" else int(value)
+
+def _parse_percents(value, gpus):
+    """{index: percent} from a config dict, "0=50,1=auto", or one value for every GPU."""
+    if isinstance(value, dict):
+        return {int(k): _parse_percent(v) for k, v in value.items()}
+    value = str(value)
+    if "=" not in value:
+        return {idx: _parse_percent(value) for idx in gpus} if value.strip() else {}
+    percents = {}
+    for item in value.split(","):
+        idx, percent = item.split("=", 1)
+        percents[int(idx)] = _parse_percent(percent)
+    return percents
+
+def resolve_settings(args):
+    """
+    Merge the agent settings: flags override LLMVERSE_* environment variables,
+    which override agent_config.json. Raises ValueError for unparsable values.
+    """
+    config_path = args.config or os.environ.get("LLMVERSE_AGENT_CONFIG") or CONFIG_FILE
+    config = _read_config(config_path)
+
+    def pick(name, config_key, default=None):
+        flag = getattr(args, name)
+        if flag is not None:
+            return flag
+        env = os.environ.get(SETTINGS_ENV[name])
+        if env:
+            return env
+        return config.get(config_key, default)
+
+    try:
+        gpus = _parse_gpus(pick("gpus", "selected_gpus", []))
+        percents = _parse_percents(pick("percent", "gpu_percents", {}), gpus)
+        target_ram = pick("target_ram", "target_ram")
+        target_ram = int(target_ram) if target_ram is not None else None
+    except ValueError as e:
+        raise ValueError(f"invalid GPU, percent or target_ram value: {e}")
+    return {
+        "wallet": pick("wallet", "wallet"),
+        "gpus": gpus,
+        "gpu_percents": percents,
+        "cpp_type": str(pick("cpp_type", "cpp_type", "isolated")).lower(),
+        "target_ram": target_ram,
+        "backend_url": pick("backend_url", "backend_url", BACKEND_URL),
+        "node_id": config.get("node_id"),
+        "cpp_id": config.get("cpp_id"),
+        "config": config_path,
+    }
+
+def validate_settings(settings):
+    """Problems that would keep the agent from connecting; empty when the settings are usable."""
+    problems = []
+    if not settings["wallet"] or not str(settings["wallet"]).strip():
+        problems.append("wallet is not set (--wallet, LLMVERSE_WALLET or agent_config.json)")
+    if not settings["gpus"]:
+        problems.append("no GPUs selected (--gpus, LLMVERSE_GPUS or agent_config.json)")
+    for idx in settings["gpus"]:
+        percent = settings["gpu_percents"].get(idx)
+        if percent is None:
+            problems.append(f"GPU {idx} has no power percent (--percent)")
+        elif percent != "auto" and not 1 <= percent <= 100:
+            problems.append(f"GPU {idx} percent must be 1-100 or 'auto', got {percent}")
+    if settings["cpp_type"] not in ("isolated", "bundled"):
+        problems.append(f"cpp_type must be 'isolated' or 'bundled', got {settings['cpp_type']!r}")
+    elif settings["cpp_type"] == "bundled" and settings["target_ram"] not in ALLOWED_BUNDLED_RAM_SIZES:
+        problems.append(f"bundled pools need target_ram in {ALLOWED_BUNDLED_RAM_SIZES}, got {settings['target_ram']}")
+    return problems
+
+def _log(message):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+def run_daemon(settings, stop=None):
+    """
+    Register, connect the selected GPUs to a CPP and report telemetry until `stop`
+    is set. Connection failures and a backend that dropped the node lead to a new
+    register + connect after a jittered backoff, never to an exit.
+    """
+    global BACKEND_URL
+    stop = stop or threading.Event()
+    BACKEND_URL = settings["backend_url"]
+    gpus = [gpu for gpu in get_gpus() if gpu["index"] in settings["gpus"]]
+    missing = set(settings["gpus"]) - {gpu["index"] for gpu in gpus}
+    if missing:
+        raise ValueError(f"GPU(s) {', '.join(map(str, sorted(missing)))} not found on this host")
+    node_id = settings["node_id"]
+    failures = 0
+    while not stop.is_set():
+        try:
+            node_id = register_agent(settings["wallet"], gpus, settings["gpu_percents"], node_id)
+            resp = create_cpp(node_id, gpus, settings["gpu_percents"], settings["cpp_type"], settings["target_ram"])
+            cpp_id = resp.get("cpp_id") or resp.get("cpp_ids", [None])[0]
+            _update_config(settings["config"], node_id=node_id, cpp_id=cpp_id)
+            _log(f"Connected node {node_id} to CPP {cpp_id} ({resp['status']})")
+            failures = 0
+            run_telemetry(node_id, settings["gpus"], stop=stop, gpu_percents=settings["gpu_percents"])
+            if not stop.is_set():
+                _log("Backend dropped this node, reconnecting")
+        except Exception as e:
+            delay = _backoff(failures)
+            failures += 1
+            _log(f"Backend unavailable ({e}), retrying in {delay:.1f}s")
+            stop.wait(delay)
+    INVENTORY.stop()
+    _log("Agent stopped")
+
+def _add_settings_args(parser):
+    parser.add_argument("--wallet", help="Solana wallet payout address")
+    parser.add_argument("--gpus", help="comma separated GPU indices, e.g. 0,1")
+    parser.add_argument("--percent", help="power percent for every GPU (1-100 or auto), or per GPU: 0=50,1=auto")
+    parser.add_argument("--cpp-type", choices=["isolated", "bundled"])
+    parser.add_argument("--target-ram", type=int, help="bundled pool size in GB")
+    parser.add_argument("--backend-url")
+    parser.add_argument("--config", help=f"config file (default: LLMVERSE_AGENT_CONFIG or {CONFIG_FILE})")
+
+def cli(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="LLMVerse agent. Without a command it opens the interactive menu.")
+    commands = parser.add_subparsers(dest="command")
+    _add_settings_args(commands.add_parser("run", help="register, connect and report telemetry without prompts"))
+    status = commands.add_parser("status", help="show the resolved settings")
+    _add_settings_args(status)
+    status.add_argument("--json", action="store_true")
+    _add_settings_args(commands.add_parser("validate-config", help="check the resolved settings and exit"))
+    args = parser.parse_args(argv)
+    if args.command is None:
+        return main()
+
+    try:
+        settings = resolve_settings(args)
+    except ValueError as e:
+        print(f"Invalid settings: {e}", file=sys.stderr)
+        return 1
+    problems = validate_settings(settings)
+    if args.command == "status":
+        if args.json:
+            print(json.dumps(dict(settings, problems=problems)))
+        else:
+            for key in ("wallet", "gpus", "gpu_percents", "cpp_type", "target_ram", "backend_url", "node_id", "cpp_id", "config"):
+                print(f"{key:>13}: {settings[key]}")
+            print(f"{'valid':>13}: {'yes' if not problems else 'no'}")
+        return 0
+    for problem in problems:
+        print(f"Invalid settings: {problem}", file=sys.stderr)
+    if problems:
+        return 1
+    if args.command == "validate-config":
+        print("Settings are valid.")
+        return 0
+
+    import signal
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    try:
+        run_daemon(settings, stop)
+    except ValueError as e:
+        print(f"Invalid settings: {e}", file=sys.stderr)
+        return 1
+    return 0
+
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
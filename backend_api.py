@@ -4,16 +4,119 @@
 # The private key is required for the script to send fees from the holder's wallet and distribute them to contributors.
 # DO NOT commit your real private key to version control or share it publicly.
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, SkipValidation, TypeAdapter, ValidationError, field_validator
 from typing import List, Dict, Optional
+from contextlib import ExitStack, asynccontextmanager, contextmanager, nullcontext
+import heapq
+import json
+import os
+import sys
+import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
 from enum import Enum
 
-app = FastAPI()
+from metrics import MetricsRegistry
+from registry_store import RegistryStore, SharedRegistryStore
+from scheduler import Scheduler, SimulatedExecutor
+from change_feed import ChangeFeed
+
+@asynccontextmanager
+async def lifespan(app):
+    # Durable mode: recover the registry from disk and snapshot it again on shutdown.
+    # LLMVERSE_SHARED=1 keeps it in SQLite so `uvicorn --workers N` share one registry.
+    data_dir = os.environ.get("LLMVERSE_DATA_DIR")
+    if data_dir and STORE is None:
+        open_registry(
+            data_dir,
+            snapshot_every=int(os.environ.get("LLMVERSE_SNAPSHOT_EVERY", "100000")),
+            fsync=os.environ.get("LLMVERSE_FSYNC") == "1",
+            shared=os.environ.get("LLMVERSE_SHARED") == "1"
+        )
+    stop = threading.Event()
+    sweeper = threading.Thread(target=_expiry_loop, args=(stop,), daemon=True)
+    sweeper.start()
+    # Other workers' changes reach this worker's feed subscribers without waiting for a request
+    poller = threading.Thread(target=_feed_catch_up_loop, args=(stop,), daemon=True) if _shared() else None
+    if poller is not None:
+        poller.start()
+    if not _shared():
+        JOB_EXECUTOR.start()
+    yield
+    JOB_EXECUTOR.stop()
+    stop.set()
+    sweeper.join()
+    if poller is not None:
+        poller.join()
+    close_registry()
+
+app = FastAPI(lifespan=lifespan)
+
+class InsertionOrder:
+    """
+    Keys of NODES / CPPS in insertion order. Every key keeps the position it was
+    appended at, and positions double as pagination cursors, so compact() can drop
+    deleted keys without moving any cursor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._positions = []  # ascending, parallel to _keys
+        self._next = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def append(self, key):
+        with self._lock:
+            self._keys.append(key)
+            self._positions.append(self._next)
+            self._next += 1
+
+    def reset(self, keys):
+        with self._lock:
+            self._keys = list(keys)
+            self._positions = list(range(len(self._keys)))
+            self._next = len(self._keys)
+
+    def compact(self, live):
+        """Drop keys that are no longer in `live`."""
+        with self._lock:
+            kept = [i for i, key in enumerate(self._keys) if key in live]
+            # New lists, so scans already running keep iterating the old ones
+            self._keys = [self._keys[i] for i in kept]
+            self._positions = [self._positions[i] for i in kept]
+
+    def scan(self, start):
+        """Yield (position, key) for every key at or after position `start`."""
+        with self._lock:
+            keys, positions, count = self._keys, self._positions, len(self._keys)
+        for i in range(bisect_left(positions, start, 0, count), count):
+            yield positions[i], keys[i]
+
+# Deleted pools stay in CPP_ORDER until they outnumber live ones by this much
+ORDER_COMPACT_SLACK = 1024
 
 NODES = {}
 CPPS = {}
+# Running node_id -> total RAM contributed across all pools, kept in step with CPPS
+CONTRIBUTIONS = {}
+# Insertion order of NODES / CPPS keys, with stable positions used as pagination cursors
+NODE_ORDER = InsertionOrder()
+CPP_ORDER = InsertionOrder()
+# wallet -> node_ids registered with it
+NODES_BY_WALLET = {}
+# wallet + host fingerprint -> node_id, so re-registering hosts are found without a scan
+NODES_BY_FINGERPRINT = {}
+# node_id -> {cpp_id: None} of the pools it contributes to
+NODE_POOLS = {}
 
 class GPUInfo(BaseModel):
     index: int
@@ -21,22 +124,18 @@ class GPUInfo(BaseModel):
     memory_gb: int
     frequency: str
     percent: str  # Accepts int as string or "auto"
+    uuid: Optional[str] = None  # NVML UUID, unique to the physical GPU
 
     # Accept both int and "auto" for percent
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate_percent
-
+    @field_validator("percent", mode="before")
     @classmethod
     def validate_percent(cls, v):
-        if isinstance(v, dict):
-            v = v.get("percent", None)
         if v == "auto":
             return v
         try:
             iv = int(v)
             if 1 <= iv <= 100:
-                return iv
+                return str(iv)
         except Exception:
             pass
         raise ValueError("percent must be 1-100 or 'auto'")
@@ -44,6 +143,8 @@ class GPUInfo(BaseModel):
 class RegisterRequest(BaseModel):
     wallet: Optional[str]
     gpus: List[GPUInfo]
+    node_id: Optional[str] = None  # id from an earlier registration, to update that node
+    machine_id: Optional[str] = None  # stable id of the host, unique across a fleet
 
 class CPPType(str, Enum):
     bundled = "bundled"
@@ -61,117 +162,1458 @@ class CPP(BaseModel):
     total_ram: int
     target_ram: int
 
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class ContributorRecord:
+    """
+    One contributor of a pool, as handed out by ContributorColumns.
+    to_dict() produces the Contributor JSON shape; in ops and snapshots a record
+    travels as a flat row (see to_row).
+    """
+    __slots__ = ("node_id", "gpu_index", "gpu_name", "memory_gb", "frequency", "percent", "ram_contributed")
+
+    def __init__(self, node_id, gpu_index, gpu_name, memory_gb, frequency, percent, ram_contributed):
+        self.node_id = node_id
+        self.gpu_index = gpu_index
+        self.gpu_name = gpu_name
+        self.memory_gb = memory_gb
+        self.frequency = frequency
+        self.percent = percent
+        self.ram_contributed = ram_contributed
+
+    @classmethod
+    def from_row(cls, row):
+        if isinstance(row, dict):
+            # Contributor dict, as written by registries before records existed
+            gpu = row["gpu"]
+            return cls(row["node_id"], gpu["index"], gpu["name"], gpu["memory_gb"],
+                       gpu["frequency"], gpu["percent"], row["ram_contributed"])
+        return cls(*row)
+
+    def to_row(self):
+        return [self.node_id, self.gpu_index, self.gpu_name, self.memory_gb,
+                self.frequency, self.percent, self.ram_contributed]
+
+    def to_dict(self):
+        return {
+            "node_id": self.node_id,
+            "gpu": {
+                "index": self.gpu_index,
+                "name": self.gpu_name,
+                "memory_gb": self.memory_gb,
+                "frequency": self.frequency,
+                "percent": self.percent
+            },
+            "ram_contributed": self.ram_contributed
+        }
+
+# (gpu_name, frequency, percent) -> the same tuple, shared by every contributor with that spec
+_GPU_SPECS = {}
+
+class ContributorColumns:
+    """
+    The contributors of one pool, stored column-wise because CPPS holds millions
+    of them: interned node ids and shared GPU spec tuples interleaved in one list,
+    GPU index, memory and contributed RAM interleaved in one int array. That is
+    about 28 bytes per contributor. Iterating yields ContributorRecords built on
+    the fly. Rows are only ever appended; withdrawals build a new instance, so a
+    reader iterating concurrently sees a consistent prefix.
+    """
+    __slots__ = ("_refs", "_ints")
+
+    def __init__(self, rows=()):
+        self._refs = []            # node_id, (gpu_name, frequency, percent), ...
+        self._ints = array("i")    # gpu_index, memory_gb, ram_contributed, ...
+        for row in rows:
+            self.append(ContributorRecord.from_row(row))
+
+    def append(self, record):
+        spec = (_intern(record.gpu_name), _intern(record.frequency), _intern(record.percent))
+        self._refs.extend((_intern(record.node_id), _GPU_SPECS.setdefault(spec, spec)))
+        # Extended last: its length is what readers go by
+        self._ints.extend((record.gpu_index, record.memory_gb, record.ram_contributed))
+
+    def __len__(self):
+        return len(self._ints) // 3
+
+    def _columns(self):
+        """(node_ids, specs, gpu indexes, memory, RAM) of the rows present when called."""
+        count = len(self)
+        refs, ints = self._refs, self._ints
+        return (refs[0:2 * count:2], refs[1:2 * count:2],
+                ints[0:3 * count:3], ints[1:3 * count:3], ints[2:3 * count:3])
+
+    def __getitem__(self, i):
+        count = len(self)
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError("contributor index out of range")
+        gpu_name, frequency, percent = self._refs[2 * i + 1]
+        gpu_index, memory_gb, ram = self._ints[3 * i:3 * i + 3]
+        return ContributorRecord(self._refs[2 * i], gpu_index, gpu_name, memory_gb, frequency, percent, ram)
+
+    def __iter__(self):
+        for node_id, (gpu_name, frequency, percent), gpu_index, memory_gb, ram in zip(*self._columns()):
+            yield ContributorRecord(node_id, gpu_index, gpu_name, memory_gb, frequency, percent, ram)
+
+    def node_ids(self):
+        """node_id of every row, in order."""
+        return self._refs[0:2 * len(self):2]
+
+    def rams(self):
+        """ram_contributed of every row, in order."""
+        return self._ints[2:3 * len(self):3]
+
+    def copy(self):
+        count = len(self)
+        columns = ContributorColumns()
+        columns._refs = self._refs[:2 * count]
+        columns._ints = self._ints[:3 * count]
+        return columns
+
+    def to_rows(self):
+        return [
+            [node_id, gpu_index, gpu_name, memory_gb, frequency, percent, ram]
+            for node_id, (gpu_name, frequency, percent), gpu_index, memory_gb, ram in zip(*self._columns())
+        ]
+
+    def to_dicts(self):
+        """Contributor JSON shape of every row, without building records."""
+        return [
+            {
+                "node_id": node_id,
+                "gpu": {"index": gpu_index, "name": gpu_name, "memory_gb": memory_gb,
+                        "frequency": frequency, "percent": percent},
+                "ram_contributed": ram
+            }
+            for node_id, (gpu_name, frequency, percent), gpu_index, memory_gb, ram in zip(*self._columns())
+        ]
+
+def _contributor_row(node_id, gpu):
+    return [node_id, gpu.index, gpu.name, gpu.memory_gb, gpu.frequency, gpu.percent, gpu.memory_gb]
+
+def _cpp_json(cpp):
+    """API (CPP model) shape of a stored pool."""
+    return dict(cpp, contributors=cpp["contributors"].to_dicts())
+
+def _json_default(value):
+    # Lets snapshots serialize contributors without converting the registry first
+    if isinstance(value, ContributorColumns):
+        return value.to_rows()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
 ALLOWED_BUNDLED_RAM_SIZES = [100, 200, 500]
 
+class OpenPoolIndex:
+    """
+    Open bundled pools of one target_ram, bucketed by remaining capacity (GB).
+    Remaining capacity is bounded by target_ram, so lookups cost O(log target_ram)
+    no matter how many pools exist.
+    """
+
+    def __init__(self, target_ram):
+        self.target_ram = target_ram
+        self._buckets = {}  # remaining GB -> {cpp_id: None}, oldest pool first
+        self._sizes = []    # sorted remaining values that have a non-empty bucket
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def bucket_count(self):
+        """Number of distinct remaining-capacity buckets a lookup searches."""
+        return len(self._sizes)
+
+    def add(self, cpp_id, remaining):
+        bucket = self._buckets.get(remaining)
+        if bucket is None:
+            bucket = self._buckets[remaining] = {}
+            insort(self._sizes, remaining)
+        bucket[cpp_id] = None
+        self._count += 1
+
+    def remove(self, cpp_id, remaining):
+        bucket = self._buckets.get(remaining)
+        if bucket is None or cpp_id not in bucket:
+            return
+        del bucket[cpp_id]
+        self._count -= 1
+        if not bucket:
+            del self._buckets[remaining]
+            del self._sizes[bisect_left(self._sizes, remaining)]
+
+    def best_fit(self, ram):
+        """
+        Return the open pool whose remaining capacity fits `ram` most tightly.
+        If no pool can take all of it, pick the one with the most room left so
+        the overshoot past target_ram is as small as possible.
+        """
+        if not self._sizes:
+            return None
+        i = bisect_left(self._sizes, ram)
+        remaining = self._sizes[i] if i < len(self._sizes) else self._sizes[-1]
+        return next(iter(self._buckets[remaining]))
+
+# Per target_ram index of bundled pools that are not full yet
+OPEN_BUNDLED_POOLS = {size: OpenPoolIndex(size) for size in ALLOWED_BUNDLED_RAM_SIZES}
+# Pool state is sharded by target_ram: picking an open pool and joining it happen
+# under that size's lock, so concurrent joins cannot overfill or lose contributors
+# while joins of other sizes (and isolated creates) proceed in parallel.
+POOL_LOCKS = {size: threading.Lock() for size in ALLOWED_BUNDLED_RAM_SIZES}
+# Bundled pools per target_ram (open + full)
+BUNDLED_POOL_COUNTS = {size: 0 for size in ALLOWED_BUNDLED_RAM_SIZES}
+
+# Metrics served by GET /metrics. Recording only touches per-thread counters;
+# registry and pool gauges are computed from existing indexes at scrape time.
+METRICS = MetricsRegistry()
+REQUEST_LATENCY = METRICS.histogram(
+    "llmverse_request_duration_seconds", "HTTP request latency by endpoint, up to the response headers.", ["method", "endpoint"]
+)
+OPEN_POOL_SEARCHES = METRICS.counter(
+    "llmverse_open_pool_searches_total", "Open bundled pool lookups by outcome.", ["target_ram", "result"]
+)
+OPEN_POOL_SEARCH_LENGTH = METRICS.histogram(
+    "llmverse_open_pool_search_buckets", "Remaining-capacity buckets searched per open pool lookup.",
+    ["target_ram"], buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+POOL_FILL_SECONDS = METRICS.histogram(
+    "llmverse_bundled_pool_fill_seconds", "Time from bundled pool creation until it is full.",
+    ["target_ram"], buckets=(1, 10, 60, 300, 900, 3600, 4 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400)
+)
+# cpp_id -> creation time of open bundled pools created by this process
+_POOL_OPENED_AT = {}
+# Upper bounds of the fill-ratio ranges reported for open pools; full pools are reported separately
+FILL_RATIO_BUCKETS = (0.25, 0.5, 0.75, 1.0)
+FILL_RATIO_LABELS = ("0-0.25", "0.25-0.5", "0.5-0.75", "0.75-1")
+
+class _CapacityStats:
+    """
+    Running totals behind GET /stats: pools, pooled RAM and pools per fill-ratio
+    range for each bundled size, isolated pools, and GPUs per model (pooled and
+    registered). Appliers take a pool's old figures out and put its new ones in
+    around every change, so reading them never scans the registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # isolated pools change under node locks only
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.bundled = {
+                size: {"pools": 0, "ram_gb": 0, "fill": [0] * (len(FILL_RATIO_BUCKETS) + 1)}
+                for size in ALLOWED_BUNDLED_RAM_SIZES
+            }
+            self.isolated = {"pools": 0, "ram_gb": 0}
+            self.pooled_models = {}      # GPU name -> [GPUs in pools, RAM they contribute]
+            self.registered_models = {}  # GPU name -> GPUs on registered nodes
+
+    def add_pool(self, cpp, sign=1):
+        with self._lock:
+            stats = self.isolated
+            if cpp["cpp_type"] == CPPType.bundled and cpp["target_ram"] in self.bundled:
+                stats = self.bundled[cpp["target_ram"]]
+                if cpp["total_ram"] >= cpp["target_ram"]:
+                    slot = len(FILL_RATIO_BUCKETS)  # full
+                else:
+                    slot = bisect_left(FILL_RATIO_BUCKETS, cpp["total_ram"] / cpp["target_ram"])
+                stats["fill"][slot] += sign
+            stats["pools"] += sign
+            stats["ram_gb"] += sign * cpp["total_ram"]
+
+    def add_contributors(self, contributors, sign=1):
+        with self._lock:
+            for contributor in contributors:
+                model = self.pooled_models.get(contributor.gpu_name)
+                if model is None:
+                    model = self.pooled_models[contributor.gpu_name] = [0, 0]
+                model[0] += sign
+                model[1] += sign * contributor.ram_contributed
+                if not model[0]:
+                    del self.pooled_models[contributor.gpu_name]
+
+    def add_node_gpus(self, gpus, sign=1):
+        with self._lock:
+            for gpu in gpus:
+                count = self.registered_models.get(gpu["name"], 0) + sign
+                if count:
+                    self.registered_models[gpu["name"]] = count
+                else:
+                    del self.registered_models[gpu["name"]]
+
+    def snapshot(self):
+        with self._lock:
+            bundled = {}
+            for size, stats in self.bundled.items():
+                full = stats["fill"][-1]
+                bundled[size] = {
+                    "pools": stats["pools"],
+                    "open": stats["pools"] - full,
+                    "full": full,
+                    "ram_gb": stats["ram_gb"],
+                    "fill_ratio": dict(zip(FILL_RATIO_LABELS + ("full",), stats["fill"])),
+                }
+            return {
+                "bundled": bundled,
+                "isolated": dict(self.isolated),
+                "total_ram_gb": self.isolated["ram_gb"] + sum(s["ram_gb"] for s in self.bundled.values()),
+                "gpu_models": {
+                    "pooled": {name: {"gpus": m[0], "ram_gb": m[1]} for name, m in self.pooled_models.items()},
+                    "registered": dict(self.registered_models),
+                },
+            }
+
+CAPACITY_STATS = _CapacityStats()
+
+def _registry_sizes():
+    return [(("nodes",), len(NODES)), (("cpps",), len(CPPS)), (("contributing_nodes",), len(CONTRIBUTIONS))]
+
+def _bundled_pool_counts():
+    samples = []
+    for size in ALLOWED_BUNDLED_RAM_SIZES:
+        open_count = len(OPEN_BUNDLED_POOLS[size])
+        samples.append(((str(size), "open"), open_count))
+        samples.append(((str(size), "full"), BUNDLED_POOL_COUNTS[size] - open_count))
+    return samples
+
+def _bundled_fill_ratios():
+    samples = []
+    for size, stats in CAPACITY_STATS.snapshot()["bundled"].items():
+        for label, count in stats["fill_ratio"].items():
+            samples.append(((str(size), label), count))
+    return samples
+
+METRICS.gauge("llmverse_registry_entries", "Entries in the backend registries.", _registry_sizes, ["registry"])
+METRICS.gauge("llmverse_bundled_pools", "Bundled pools by target_ram and state.", _bundled_pool_counts, ["target_ram", "state"])
+METRICS.gauge(
+    "llmverse_bundled_pool_fill_ratio", "Bundled pools per fill-ratio range (total_ram / target_ram).",
+    _bundled_fill_ratios, ["target_ram", "fill"]
+)
+
+class _LatencyMiddleware:
+    """
+    Pure ASGI middleware recording REQUEST_LATENCY per matched route template.
+    Timed up to the response start, so /events and NDJSON streams record the time
+    to their headers rather than how long the client stayed connected.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        observed = False
+
+        def observe():
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], endpoint).observe(time.perf_counter() - start)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start" and not observed:
+                observe()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                observe()
+
+app.add_middleware(_LatencyMiddleware)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+# Registry mutations are expressed as plain-dict records ("ops") and applied via
+# _commit, so the same code path serves live requests and log replay on recovery.
+STORE = None  # RegistryStore when LLMVERSE_DATA_DIR is set, otherwise memory only
+
+# Striped by node_id so ledger updates of different nodes rarely contend
+_LEDGER_LOCKS = [threading.Lock() for _ in range(64)]
+
+def _record_contribution(node_id, ram):
+    with _LEDGER_LOCKS[hash(node_id) % len(_LEDGER_LOCKS)]:
+        total = CONTRIBUTIONS.get(node_id, 0) + ram
+        if total:
+            CONTRIBUTIONS[node_id] = total
+        else:
+            CONTRIBUTIONS.pop(node_id, None)
+
+class _RegistryGate:
+    """
+    Shared/exclusive gate around the registry. Applying ops enters it shared, so
+    mutations never wait on each other here; snapshots and consistency checks
+    enter it exclusively to see a registry that is not changing underneath them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                if not self._active:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            self._exclusive = True
+            while self._active:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+_GATE = _RegistryGate()
+
+# Typed registry events for GET /events, published by the appliers below, so
+# live requests, log replay and shared-log catch-up all produce them.
+FEED = ChangeFeed()
+EVENT_TYPES = (
+    "node_registered", "node_updated", "node_power_changed", "pool_created", "contributor_joined",
+    "contributor_left", "pool_capacity_changed", "pool_full", "pool_removed", "registry_reset",
+)
+
+def _pool_event(cpp):
+    return {"cpp_id": cpp["cpp_id"], "cpp_type": cpp["cpp_type"], "total_ram": cpp["total_ram"],
+            "target_ram": cpp["target_ram"]}
+
+def _node_fingerprint(wallet, gpus, machine_id=None):
+    """
+    Stable identity of a host: its wallet, machine id and GPUs. None unless the host
+    sent something unique to it (a machine id, or the UUID of every GPU): fleet hosts
+    share a wallet and identical hardware, and must not collapse into one node.
+    """
+    if machine_id is None and not (gpus and all(gpu.get("uuid") for gpu in gpus)):
+        return None
+    hardware = sorted((gpu["index"], gpu["name"], gpu["memory_gb"], gpu.get("uuid") or "") for gpu in gpus)
+    return json.dumps([wallet, machine_id, hardware])
+
+def _apply_register(op):
+    node_id = op["node_id"]
+    node = NODES.get(node_id)
+    if node is None:
+        NODE_ORDER.append(node_id)
+        NODES_BY_WALLET.setdefault(op["wallet"], []).append(node_id)
+    else:
+        # Re-registration updates the node in place
+        CAPACITY_STATS.add_node_gpus(node["gpus"], -1)
+        fingerprint = _node_fingerprint(node["wallet"], node["gpus"], node.get("machine_id"))
+        if fingerprint is not None and NODES_BY_FINGERPRINT.get(fingerprint) == node_id:
+            del NODES_BY_FINGERPRINT[fingerprint]
+        if node["wallet"] != op["wallet"]:
+            wallet_nodes = NODES_BY_WALLET[node["wallet"]]
+            wallet_nodes.remove(node_id)
+            if not wallet_nodes:
+                del NODES_BY_WALLET[node["wallet"]]
+            NODES_BY_WALLET.setdefault(op["wallet"], []).append(node_id)
+    NODES[node_id] = {
+        "wallet": op["wallet"],
+        "gpus": op["gpus"]
+    }
+    if op.get("machine_id") is not None:
+        NODES[node_id]["machine_id"] = op["machine_id"]
+    fingerprint = _node_fingerprint(op["wallet"], op["gpus"], op.get("machine_id"))
+    if fingerprint is not None:
+        NODES_BY_FINGERPRINT[fingerprint] = node_id
+    CAPACITY_STATS.add_node_gpus(op["gpus"])
+    FEED.publish("node_registered" if node is None else "node_updated",
+                 {"node_id": node_id, "wallet": op["wallet"], "gpus": op["gpus"]})
+
+def _apply_create_cpp(op):
+    cpp = dict(op["cpp"])
+    cpp["contributors"] = ContributorColumns(cpp["contributors"])
+    cpp_id = cpp["cpp_id"]
+    CPPS[cpp_id] = cpp
+    CPP_ORDER.append(cpp_id)
+    for contributor in cpp["contributors"]:
+        _record_contribution(contributor.node_id, contributor.ram_contributed)
+        NODE_POOLS.setdefault(contributor.node_id, {})[cpp_id] = None
+    open_pools = OPEN_BUNDLED_POOLS.get(cpp["target_ram"])
+    if cpp["cpp_type"] == CPPType.bundled and open_pools is not None:
+        BUNDLED_POOL_COUNTS[cpp["target_ram"]] += 1
+        if cpp["total_ram"] < cpp["target_ram"]:
+            open_pools.add(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+    CAPACITY_STATS.add_pool(cpp)
+    CAPACITY_STATS.add_contributors(cpp["contributors"])
+    _sync_job_capacity(cpp_id, cpp)
+    FEED.publish("pool_created", dict(_pool_event(cpp), node_ids=cpp["contributors"].node_ids()))
+    if cpp["cpp_type"] == CPPType.bundled and cpp["total_ram"] >= cpp["target_ram"]:
+        FEED.publish("pool_full", _pool_event(cpp))
+
+def _apply_join_cpp(op):
+    cpp_id = op["cpp_id"]
+    cpp = CPPS[cpp_id]
+    open_pools = OPEN_BUNDLED_POOLS[cpp["target_ram"]]
+    open_pools.remove(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+    CAPACITY_STATS.add_pool(cpp, -1)
+    joined = []
+    for row in op["contributors"]:
+        contributor = ContributorRecord.from_row(row)
+        CAPACITY_STATS.add_contributors([contributor])
+        cpp["contributors"].append(contributor)
+        cpp["total_ram"] += contributor.ram_contributed
+        _record_contribution(contributor.node_id, contributor.ram_contributed)
+        NODE_POOLS.setdefault(contributor.node_id, {})[cpp_id] = None
+        joined.append(contributor.node_id)
+    if cpp["total_ram"] < cpp["target_ram"]:
+        open_pools.add(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+    CAPACITY_STATS.add_pool(cpp)
+    _sync_job_capacity(cpp_id, cpp)
+    FEED.publish("contributor_joined", dict(_pool_event(cpp), node_ids=list(dict.fromkeys(joined))))
+    FEED.publish("pool_capacity_changed", _pool_event(cpp))
+    if cpp["total_ram"] >= cpp["target_ram"]:
+        # Joins only go to open pools, so this join filled it
+        FEED.publish("pool_full", _pool_event(cpp))
+
+def _apply_withdraw(op):
+    """
+    Take every contribution of a node out of its pools. Bundled pools left below
+    target_ram go back to the open-pool index; pools left empty are removed.
+    """
+    node_id = op["node_id"]
+    for cpp_id in NODE_POOLS.pop(node_id, ()):
+        cpp = CPPS.get(cpp_id)
+        if cpp is None:
+            continue
+        open_pools = None
+        if cpp["cpp_type"] == CPPType.bundled:
+            open_pools = OPEN_BUNDLED_POOLS.get(cpp["target_ram"])
+        if open_pools is not None:
+            open_pools.remove(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+        CAPACITY_STATS.add_pool(cpp, -1)
+        kept = ContributorColumns()
+        for contributor in cpp["contributors"]:
+            if contributor.node_id == node_id:
+                cpp["total_ram"] -= contributor.ram_contributed
+                _record_contribution(node_id, -contributor.ram_contributed)
+                CAPACITY_STATS.add_contributors([contributor], -1)
+            else:
+                kept.append(contributor)
+        cpp["contributors"] = kept
+        if kept:
+            CAPACITY_STATS.add_pool(cpp)
+        if not kept:
+            # The id stays in CPP_ORDER as a tombstone that listings skip, until compaction
+            del CPPS[cpp_id]
+            _POOL_OPENED_AT.pop(cpp_id, None)
+            if open_pools is not None:
+                BUNDLED_POOL_COUNTS[cpp["target_ram"]] -= 1
+        elif open_pools is not None and cpp["total_ram"] < cpp["target_ram"]:
+            open_pools.add(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+        _sync_job_capacity(cpp_id, cpp, removed=not kept)
+        FEED.publish("contributor_left", dict(_pool_event(cpp), node_ids=[node_id]))
+        FEED.publish("pool_removed" if not kept else "pool_capacity_changed", _pool_event(cpp))
+    if len(CPP_ORDER) - len(CPPS) > len(CPPS) + ORDER_COMPACT_SLACK:
+        CPP_ORDER.compact(CPPS)
+
+def _apply_set_power(op):
+    node = NODES.get(op["node_id"])
+    if node is None:
+        return
+    for gpu in node["gpus"]:
+        percent = op["gpus"].get(str(gpu["index"]))
+        if percent is not None:
+            gpu["effective_percent"] = percent
+    FEED.publish("node_power_changed", {"node_id": op["node_id"], "gpus": op["gpus"]})
+
+_APPLIERS = {
+    "register": _apply_register,
+    "create_cpp": _apply_create_cpp,
+    "join_cpp": _apply_join_cpp,
+    "withdraw": _apply_withdraw,
+    "set_power": _apply_set_power,
+}
+
+# Bumped after every applied op, so an unchanged version means unchanged NODES /
+# CPPS. The epoch changes whenever the registry is reset or reloaded, so ETags
+# handed out before that never match again.
+REGISTRY_VERSION = 0
+_REGISTRY_EPOCH = uuid.uuid4().hex[:8]
+_VERSION_LOCK = threading.Lock()
+
+def _apply(op):
+    global REGISTRY_VERSION
+    _APPLIERS[op["op"]](op)
+    # After the mutation: a reader that saw the old version may have read part of
+    # the new state, but a body is never cached under a version newer than it
+    with _VERSION_LOCK:
+        REGISTRY_VERSION += 1
+
+def _shared():
+    return STORE is not None and STORE.shared
+
+# Shared store only: orders applying this worker's own ops against catching up on
+# other workers' ops, so nothing is applied twice
+_REPLICA_LOCK = threading.Lock()
+
+def _commit(*ops):
+    """Write-ahead log the ops (when a store is attached), then apply them in memory."""
+    with _group_commit():
+        with _REPLICA_LOCK if _shared() else nullcontext(), _GATE.shared():
+            if STORE is not None:
+                STORE.append(ops)
+            for op in ops:
+                _apply(op)
+        if STORE is not None and STORE.needs_snapshot():
+            _SNAPSHOT_WANTED.set()
+
+def _snapshot(force=False):
+    """
+    Copy the registry under the gate, which only takes a moment, then serialize
+    and write the copy while mutations go on.
+    """
+    with _group_commit(), _GATE.exclusive():
+        if not (force or STORE.needs_snapshot()):
+            return
+        seq = STORE.begin_snapshot()
+        # Appliers change contributor lists, pool totals and GPU power in place
+        state = {
+            "nodes": {node_id: dict(node, gpus=[dict(gpu) for gpu in node["gpus"]]) for node_id, node in NODES.items()},
+            "cpps": {cpp_id: dict(cpp, contributors=cpp["contributors"].copy()) for cpp_id, cpp in CPPS.items()},
+        }
+    STORE.write_snapshot(state, seq, default=_json_default)
+
+# Snapshots run on their own thread, so no request waits for one: _commit only wakes it
+_SNAPSHOT_WANTED = threading.Event()
+_SNAPSHOTTER = None  # (thread, stop event) while a store is attached
+
+def _snapshot_loop(stop):
+    while True:
+        _SNAPSHOT_WANTED.wait()
+        _SNAPSHOT_WANTED.clear()
+        if stop.is_set():
+            return
+        try:
+            _snapshot()
+        except Exception as e:
+            print(f"Registry snapshot failed: {e}", file=sys.stderr)
+
+@contextmanager
+def _group_commit():
+    """
+    Share one log flush between all _commit calls made inside the block. With a
+    shared store the block is also the write transaction that makes decisions
+    like pool joins atomic across workers, and it starts by catching up.
+    """
+    if STORE is None:
+        yield
+    else:
+        with STORE.batch():
+            _catch_up()
+            yield
+
+def _catch_up():
+    """Apply the ops other workers appended to the shared log since this worker last looked."""
+    if not _shared():
+        return
+    with _REPLICA_LOCK:
+        records = None if STORE.needs_reload else STORE.catch_up()
+        if records is None:
+            # Too far behind a compaction (or a failed transaction): reload everything
+            with _GATE.exclusive():
+                _load_registry(STORE)
+        elif records:
+            with _GATE.shared():
+                for op in records:
+                    _apply(op)
+
+def _reset_registry(nodes, cpps):
+    """Replace the registry contents and rebuild every derived index from them."""
+    global _REGISTRY_EPOCH
+    NODES.clear()
+    NODES.update(nodes)
+    CPPS.clear()
+    for cpp_id, cpp in cpps.items():
+        cpp["contributors"] = ContributorColumns(cpp["contributors"])
+        CPPS[cpp_id] = cpp
+    NODE_ORDER.reset(NODES)
+    CPP_ORDER.reset(CPPS)
+    NODES_BY_WALLET.clear()
+    NODES_BY_FINGERPRINT.clear()
+    for node_id, node in NODES.items():
+        NODES_BY_WALLET.setdefault(node["wallet"], []).append(node_id)
+        fingerprint = _node_fingerprint(node["wallet"], node["gpus"], node.get("machine_id"))
+        if fingerprint is not None:
+            NODES_BY_FINGERPRINT[fingerprint] = node_id
+    NODE_POOLS.clear()
+    for cpp_id, cpp in CPPS.items():
+        for node_id in cpp["contributors"].node_ids():
+            NODE_POOLS.setdefault(node_id, {})[cpp_id] = None
+    CONTRIBUTIONS.clear()
+    CONTRIBUTIONS.update(rebuild_contributions())
+    for size in ALLOWED_BUNDLED_RAM_SIZES:
+        OPEN_BUNDLED_POOLS[size] = OpenPoolIndex(size)
+        BUNDLED_POOL_COUNTS[size] = 0
+    _POOL_OPENED_AT.clear()
+    with _EXPIRY_LOCK:
+        LAST_SEEN.clear()
+        _EXPIRY_HEAP.clear()
+        _EXPIRY_SCHEDULED.clear()
+    for cpp_id, cpp in CPPS.items():
+        open_pools = OPEN_BUNDLED_POOLS.get(cpp["target_ram"])
+        if cpp["cpp_type"] == CPPType.bundled and open_pools is not None:
+            BUNDLED_POOL_COUNTS[cpp["target_ram"]] += 1
+            if cpp["total_ram"] < cpp["target_ram"]:
+                open_pools.add(cpp_id, cpp["target_ram"] - cpp["total_ram"])
+    CAPACITY_STATS.reset()
+    for node in NODES.values():
+        CAPACITY_STATS.add_node_gpus(node["gpus"])
+    # Pools that are unchanged keep their running jobs; set_capacity only acts on differences
+    SCHEDULER.retain_pools(CPPS)
+    for cpp_id, cpp in CPPS.items():
+        CAPACITY_STATS.add_pool(cpp)
+        CAPACITY_STATS.add_contributors(cpp["contributors"])
+        _sync_job_capacity(cpp_id, cpp)
+    _REGISTRY_EPOCH = uuid.uuid4().hex[:8]
+
+def _load_registry(store):
+    state, records = store.load()
+    # Replaying history would flood the feed; subscribers get one reset event instead
+    FEED.muted = True
+    try:
+        if state is not None:
+            _reset_registry(state["nodes"], state["cpps"])
+        else:
+            _reset_registry({}, {})
+        for op in records:
+            _apply(op)
+    finally:
+        FEED.muted = False
+    FEED.publish("registry_reset", {})
+    # Last-seen times are not persisted: recovered nodes get a full TTL to check in again
+    now = time.time()
+    for node_id in list(NODE_POOLS):
+        _track_node(node_id, now)
+
+def open_registry(data_dir, snapshot_every=100000, fsync=False, shared=False):
+    """
+    Recover NODES / CPPS from `data_dir` and log every later mutation there. With
+    shared=True the log is a SQLite database that several worker processes share.
+    """
+    global STORE, _SNAPSHOTTER
+    store_class = SharedRegistryStore if shared else RegistryStore
+    store = store_class(data_dir, snapshot_every=snapshot_every, fsync=fsync)
+    _load_registry(store)
+    STORE = store
+    stop = threading.Event()
+    _SNAPSHOTTER = (threading.Thread(target=_snapshot_loop, args=(stop,), daemon=True), stop)
+    _SNAPSHOTTER[0].start()
+
+def close_registry():
+    """Compact the registry into a fresh snapshot and detach the store."""
+    global STORE, _SNAPSHOTTER
+    if STORE is None:
+        return
+    thread, stop = _SNAPSHOTTER
+    stop.set()
+    _SNAPSHOT_WANTED.set()
+    thread.join()
+    _SNAPSHOTTER = None
+    _snapshot(force=True)
+    STORE.close()
+    STORE = None
+
 class CPPCreateRequest(BaseModel):
     node_id: str
     gpus: List[GPUInfo]
     cpp_type: CPPType = CPPType.isolated
     target_ram: Optional[int] = None  # Only for bundled
 
+# Serializes the lookup and commit of registrations, so one host cannot end up as two nodes
+_REGISTER_LOCK = threading.Lock()
+# Striped per-node locks, taken before any pool size lock
+_NODE_LOCKS = [threading.Lock() for _ in range(64)]
+
 @app.post("/register_agent")
 def register_agent(req: RegisterRequest):
-    node_id = str(uuid.uuid4())
-    NODES[node_id] = {
-        "wallet": req.wallet,
-        "gpus": req.gpus
+    """
+    Register a node, or update it in place if it is already known: by the node_id
+    the agent saved from an earlier registration, else by wallet + host fingerprint
+    (needs machine_id or GPU UUIDs; without them every unknown agent is a new node).
+    """
+    gpus = [gpu.model_dump(exclude_none=True) for gpu in req.gpus]
+    with _group_commit(), _REGISTER_LOCK:
+        node_id = req.node_id if req.node_id in NODES else None
+        if node_id is None:
+            fingerprint = _node_fingerprint(req.wallet, gpus, req.machine_id)
+            if fingerprint is not None:
+                node_id = NODES_BY_FINGERPRINT.get(fingerprint)
+        status = "updated" if node_id is not None else "registered"
+        if node_id is None:
+            node_id = str(uuid.uuid4())
+        # Touched under the node lock, so an expiry sweep that already picked the node skips it
+        with _NODE_LOCKS[hash(node_id) % len(_NODE_LOCKS)]:
+            touch_node(node_id)
+            _commit({
+                "op": "register",
+                "node_id": node_id,
+                "wallet": req.wallet,
+                "gpus": gpus,
+                "machine_id": req.machine_id
+            })
+    return {"node_id": node_id, "status": status}
+
+def _withdraw_node(node_id):
+    """Remove a node's earlier contributions under the locks of every pool size they touch."""
+    pools = [CPPS.get(cpp_id) for cpp_id in list(NODE_POOLS.get(node_id, ()))]
+    sizes = sorted({
+        cpp["target_ram"] for cpp in pools
+        if cpp is not None and cpp["cpp_type"] == CPPType.bundled and cpp["target_ram"] in POOL_LOCKS
+    })
+    with ExitStack() as stack:
+        for size in sizes:
+            stack.enter_context(POOL_LOCKS[size])
+        if NODE_POOLS.get(node_id):
+            _commit({"op": "withdraw", "node_id": node_id})
+
+def _join_or_create_bundled(req, target_ram):
+    """Bundled half of create_cpp; callers hold POOL_LOCKS[target_ram]."""
+    # Best-fit lookup of an open bundled pool of the requested size
+    incoming_ram = sum(gpu.memory_gb for gpu in req.gpus)
+    open_pools = OPEN_BUNDLED_POOLS[target_ram]
+    OPEN_POOL_SEARCH_LENGTH.labels(str(target_ram)).observe(open_pools.bucket_count())
+    open_cpp_id = open_pools.best_fit(incoming_ram)
+    OPEN_POOL_SEARCHES.labels(str(target_ram), "miss" if open_cpp_id is None else "hit").inc()
+    if open_cpp_id is not None:
+        contributors = [_contributor_row(req.node_id, gpu) for gpu in req.gpus]
+        _commit({"op": "join_cpp", "cpp_id": open_cpp_id, "contributors": contributors})
+        cpp = CPPS[open_cpp_id]
+        if cpp["total_ram"] >= cpp["target_ram"]:
+            opened_at = _POOL_OPENED_AT.pop(open_cpp_id, None)
+            if opened_at is not None:
+                POOL_FILL_SECONDS.labels(str(target_ram)).observe(time.time() - opened_at)
+        return {
+            "cpp_id": cpp["cpp_id"],
+            "status": "bundled_cpp_joined",
+            "is_full": cpp["total_ram"] >= cpp["target_ram"],
+            "total_ram": cpp["total_ram"],
+            "target_ram": cpp["target_ram"]
+        }
+    # No open pool, create new
+    cpp_id = str(uuid.uuid4())
+    total_ram = sum(gpu.memory_gb for gpu in req.gpus)
+    cpp = {
+        "cpp_id": cpp_id,
+        "cpp_type": CPPType.bundled,
+        "contributors": [_contributor_row(req.node_id, gpu) for gpu in req.gpus],
+        "total_ram": total_ram,
+        "target_ram": target_ram
+    }
+    _commit({"op": "create_cpp", "cpp": cpp})
+    is_full = total_ram >= target_ram
+    if is_full:
+        POOL_FILL_SECONDS.labels(str(target_ram)).observe(0)
+    else:
+        _POOL_OPENED_AT[cpp_id] = time.time()
+    return {
+        "cpp_id": cpp_id,
+        "status": "bundled_cpp_created",
+        "is_full": is_full,
+        "total_ram": total_ram,
+        "target_ram": target_ram
     }
-    return {"node_id": node_id, "status": "registered"}
 
 @app.post("/create_cpp")
 def create_cpp(req: CPPCreateRequest):
+    """
+    Connect a node's GPUs to pools; its pools from an earlier create_cpp are replaced.
+    A request identical to the node's current contribution changes nothing.
+    """
+    if req.cpp_type not in (CPPType.isolated, CPPType.bundled):
+        raise HTTPException(status_code=400, detail="Unknown CPP type")
+    if req.cpp_type == CPPType.bundled and req.target_ram not in ALLOWED_BUNDLED_RAM_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid pool size. Allowed bundled pool sizes: {ALLOWED_BUNDLED_RAM_SIZES} GB"
+        )
+    # Node lock first, then pool size locks: a node's withdraw and create never interleave
+    with _group_commit(), _NODE_LOCKS[hash(req.node_id) % len(_NODE_LOCKS)]:
+        # Touch first: expire_nodes rechecks LAST_SEEN under this lock before withdrawing
+        touch_node(req.node_id)
+        # Agent restarts and reconnects resend the same request; keep the node where it is
+        result = _unchanged_contribution(req)
+        if result is None:
+            _withdraw_node(req.node_id)
+            result = _create_cpp(req)
+    return result
+
+def _unchanged_contribution(req):
+    """create_cpp's response for the node's current pools if `req` would recreate exactly them, else None."""
+    pools = [CPPS.get(cpp_id) for cpp_id in list(NODE_POOLS.get(req.node_id, ()))]
+    if not pools or None in pools:
+        return None
+    wanted = sorted(_contributor_row(req.node_id, gpu) for gpu in req.gpus)
+    current = sorted(c.to_row() for cpp in pools for c in cpp["contributors"] if c.node_id == req.node_id)
+    if wanted != current:
+        return None
+    if req.cpp_type == CPPType.isolated:
+        if len(pools) != len(req.gpus) or any(cpp["cpp_type"] != CPPType.isolated for cpp in pools):
+            return None
+        by_gpu = {cpp["contributors"][0].gpu_index: cpp["cpp_id"] for cpp in pools}
+        return {"cpp_ids": [by_gpu[gpu.index] for gpu in req.gpus], "status": "isolated_cpp_unchanged"}
+    cpp = pools[0]
+    if len(pools) != 1 or cpp["cpp_type"] != CPPType.bundled or cpp["target_ram"] != req.target_ram:
+        return None
+    return {
+        "cpp_id": cpp["cpp_id"],
+        "status": "bundled_cpp_unchanged",
+        "is_full": cpp["total_ram"] >= cpp["target_ram"],
+        "total_ram": cpp["total_ram"],
+        "target_ram": cpp["target_ram"]
+    }
+
+def _create_cpp(req):
     if req.cpp_type == CPPType.isolated:
         # Each GPU gets its own isolated pool
-        cpp_ids = []
-        for gpu in req.gpus:
-            cpp_id = str(uuid.uuid4())
-            contributor = Contributor(
-                node_id=req.node_id,
-                gpu=gpu,
-                ram_contributed=gpu.memory_gb
-            )
-            cpp = CPP(
-                cpp_id=cpp_id,
-                cpp_type=CPPType.isolated,
-                contributors=[contributor],
-                total_ram=gpu.memory_gb,
-                target_ram=gpu.memory_gb
-            )
-            CPPS[cpp_id] = cpp.dict()
-            cpp_ids.append(cpp_id)
-        return {"cpp_ids": cpp_ids, "status": "isolated_cpp_created"}
-    elif req.cpp_type == CPPType.bundled:
-        # Only allow predefined pool sizes
-        if req.target_ram not in ALLOWED_BUNDLED_RAM_SIZES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid pool size. Allowed bundled pool sizes: {ALLOWED_BUNDLED_RAM_SIZES} GB"
-            )
-        target_ram = req.target_ram
-        # Try to find an open bundled pool of the requested size
-        for cpp in CPPS.values():
-            if (
-                cpp["cpp_type"] == CPPType.bundled
-                and cpp["target_ram"] == target_ram
-                and cpp["total_ram"] < cpp["target_ram"]
-            ):
-                # Add as contributor if not already
-                for gpu in req.gpus:
-                    ram = gpu.memory_gb
-                    contributor = Contributor(
-                        node_id=req.node_id,
-                        gpu=gpu,
-                        ram_contributed=ram
-                    )
-                    cpp["contributors"].append(contributor.dict())
-                    cpp["total_ram"] += ram
-                is_full = cpp["total_ram"] >= cpp["target_ram"]
-                return {
-                    "cpp_id": cpp["cpp_id"],
-                    "status": "bundled_cpp_joined",
-                    "is_full": is_full,
-                    "total_ram": cpp["total_ram"],
-                    "target_ram": cpp["target_ram"]
-                }
-        # No open pool, create new
-        cpp_id = str(uuid.uuid4())
-        contributors = []
-        total_ram = 0
+        ops = []
         for gpu in req.gpus:
-            ram = gpu.memory_gb
-            contributor = Contributor(
-                node_id=req.node_id,
-                gpu=gpu,
-                ram_contributed=ram
-            )
-            contributors.append(contributor)
-            total_ram += ram
-        cpp = CPP(
-            cpp_id=cpp_id,
-            cpp_type=CPPType.bundled,
-            contributors=contributors,
-            total_ram=total_ram,
-            target_ram=target_ram
+            cpp = {
+                "cpp_id": str(uuid.uuid4()),
+                "cpp_type": CPPType.isolated,
+                "contributors": [_contributor_row(req.node_id, gpu)],
+                "total_ram": gpu.memory_gb,
+                "target_ram": gpu.memory_gb
+            }
+            ops.append({"op": "create_cpp", "cpp": cpp})
+        _commit(*ops)
+        return {"cpp_ids": [op["cpp"]["cpp_id"] for op in ops], "status": "isolated_cpp_created"}
+    target_ram = req.target_ram
+    # The log is flushed when create_cpp's _group_commit exits, after the size lock is released
+    with POOL_LOCKS[target_ram]:
+        return _join_or_create_bundled(req, target_ram)
+
+# Liveness: a node that has not registered, created pools or sent telemetry for
+# NODE_TTL seconds is expired and its contributions are withdrawn.
+NODE_TTL = float(os.environ.get("LLMVERSE_NODE_TTL", "600"))
+EXPIRY_SWEEP_INTERVAL = 10
+# node_id -> time it was last seen
+LAST_SEEN = {}
+# Min-heap of (deadline, node_id) with one entry per tracked node. Touching a node
+# only updates LAST_SEEN; a stale deadline is pushed back when it reaches the top,
+# so a sweep costs O(expired + rescheduled), never a scan of all nodes.
+_EXPIRY_HEAP = []
+_EXPIRY_SCHEDULED = set()
+_EXPIRY_LOCK = threading.Lock()
+# Shared store only: touches not yet published to the other workers
+_PENDING_SEEN = {}
+NODES_EXPIRED = METRICS.counter(
+    "llmverse_nodes_expired_total", "Nodes whose contributions were withdrawn after NODE_TTL without contact"
+)
+
+def touch_node(node_id, now=None):
+    """Record that a node is alive; it expires NODE_TTL seconds after its last touch."""
+    now = time.time() if now is None else now
+    if _shared():
+        _PENDING_SEEN[node_id] = now
+    _track_node(node_id, now)
+
+def _track_node(node_id, now):
+    LAST_SEEN[node_id] = now
+    if node_id not in _EXPIRY_SCHEDULED:
+        with _EXPIRY_LOCK:
+            if node_id not in _EXPIRY_SCHEDULED:
+                _EXPIRY_SCHEDULED.add(node_id)
+                heapq.heappush(_EXPIRY_HEAP, (now + NODE_TTL, node_id))
+
+def _pop_expired(now):
+    expired = []
+    with _EXPIRY_LOCK:
+        while _EXPIRY_HEAP and _EXPIRY_HEAP[0][0] <= now:
+            _, node_id = heapq.heappop(_EXPIRY_HEAP)
+            deadline = LAST_SEEN.get(node_id, 0) + NODE_TTL
+            if deadline > now:
+                heapq.heappush(_EXPIRY_HEAP, (deadline, node_id))
+            else:
+                _EXPIRY_SCHEDULED.discard(node_id)
+                expired.append(node_id)
+    return expired
+
+def expire_nodes(now=None):
+    """
+    Withdraw the contributions of every node not seen for NODE_TTL seconds, which
+    reopens the bundled pools they were in. Returns the expired node_ids.
+    """
+    now = time.time() if now is None else now
+    candidates = _pop_expired(now)
+    if candidates and _shared():
+        # The node may have been talking to another worker
+        _publish_seen()
+        for node_id, seen in STORE.last_seen(candidates).items():
+            if seen + NODE_TTL > now:
+                _track_node(node_id, seen)
+    expired = []
+    with _group_commit():
+        for node_id in candidates:
+            with _NODE_LOCKS[hash(node_id) % len(_NODE_LOCKS)]:
+                if LAST_SEEN.get(node_id, 0) + NODE_TTL > now:
+                    continue  # seen again since it was popped, and rescheduled by that
+                LAST_SEEN.pop(node_id, None)
+                _withdraw_node(node_id)
+            expired.append(node_id)
+        if expired and _shared():
+            STORE.forget_seen(expired)
+    NODES_EXPIRED.inc(len(expired))
+    return expired
+
+def _publish_seen():
+    """Shared store only: make this worker's recent touches visible to the other workers."""
+    global _PENDING_SEEN
+    seen, _PENDING_SEEN = _PENDING_SEEN, {}
+    STORE.record_seen(seen)
+
+def _expiry_loop(stop):
+    while not stop.wait(EXPIRY_SWEEP_INTERVAL):
+        try:
+            if _shared():
+                _publish_seen()
+            expire_nodes()
+        except Exception as e:
+            print(f"Node expiry sweep failed: {e}", file=sys.stderr)
+
+MAX_BATCH_SIZE = 1000
+
+# The endpoints validate the items themselves, in one call per batch, so that a
+# malformed item is reported in its own result instead of rejecting the batch
+class BatchRegisterRequest(BaseModel):
+    agents: List[SkipValidation[RegisterRequest]]
+
+class BatchCPPCreateRequest(BaseModel):
+    pools: List[SkipValidation[CPPCreateRequest]]
+
+_REGISTER_ITEMS = TypeAdapter(List[RegisterRequest])
+_CPP_CREATE_ITEMS = TypeAdapter(List[CPPCreateRequest])
+
+def _check_batch_size(items):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large. At most {MAX_BATCH_SIZE} items per request"
         )
-        CPPS[cpp_id] = cpp.dict()
-        is_full = total_ram >= target_ram
-        return {
-            "cpp_id": cpp_id,
-            "status": "bundled_cpp_created",
-            "is_full": is_full,
-            "total_ram": total_ram,
-            "target_ram": target_ram
-        }
+
+def _validate_batch(adapter, items):
+    """
+    Validate every item with one call. Returns one entry per item: its model, or
+    the {"status": "error", ...} result of an item that failed validation.
+    """
+    try:
+        return adapter.validate_python(items)
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors(include_url=False, include_context=False):
+            # loc[0] is the item's position; the rest is relative to the item
+            errors.setdefault(error["loc"][0], []).append(dict(error, loc=error["loc"][1:]))
+    results = [
+        {"status": "error", "status_code": 422, "detail": jsonable_encoder(errors[i])} if i in errors else None
+        for i in range(len(items))
+    ]
+    valid = [i for i in range(len(items)) if i not in errors]
+    for i, model in zip(valid, adapter.validate_python([items[i] for i in valid])):
+        results[i] = model
+    return results
+
+def _batch_item(handler, item):
+    """handler's response for one validated batch item, or its error result."""
+    if isinstance(item, dict):
+        return item
+    try:
+        return handler(item)
+    except HTTPException as e:
+        return {"status": "error", "status_code": e.status_code, "detail": e.detail}
+
+@app.post("/register_agents")
+def register_agents(req: BatchRegisterRequest):
+    """
+    Register many agents in one round trip; results are in request order. An item
+    that fails validation gets an error result and does not affect the others.
+    """
+    _check_batch_size(req.agents)
+    items = _validate_batch(_REGISTER_ITEMS, req.agents)
+    with _group_commit():
+        results = [_batch_item(register_agent, item) for item in items]
+    return {"results": results}
+
+@app.post("/create_cpps")
+def create_cpps(req: BatchCPPCreateRequest):
+    """
+    Apply many create_cpp requests in order with one log flush. Each result is the
+    create_cpp response, or {"status": "error", ...} for an item that was rejected;
+    a rejected item does not affect the others.
+    """
+    _check_batch_size(req.pools)
+    items = _validate_batch(_CPP_CREATE_ITEMS, req.pools)
+    with _group_commit():
+        results = [_batch_item(create_cpp, item) for item in items]
+    return {"results": results}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def _parse_cursor(cursor):
+    if cursor is None:
+        return 0
+    try:
+        start = int(cursor)
+        if start >= 0:
+            return start
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _scan(order, registry, start, match):
+    """Yield (position, key, value) for entries at or after `start` that match."""
+    for pos, key in order.scan(start):
+        value = registry.get(key)
+        if value is not None and match(key, value):
+            yield pos, key, value
+
+def _page(rows, limit, to_item):
+    items = []
+    next_cursor = None
+    for pos, key, value in rows:
+        if len(items) == limit:
+            # Resume exactly at the next matching entry
+            next_cursor = str(pos)
+            break
+        items.append(to_item(key, value))
+    return {"items": items, "next_cursor": next_cursor}
+
+def _ndjson(rows, limit, to_item):
+    for n, (pos, key, value) in enumerate(rows):
+        if limit is not None and n == limit:
+            break
+        yield json.dumps(jsonable_encoder(to_item(key, value))) + "\n"
+
+# Dashboards poll the listings: every response carries the registry version as
+# its ETag, If-None-Match gets a 304, and the unfiltered dumps are serialized once
+# per version. In shared mode each worker has its own version counter.
+_RESPONSE_CACHE = {}  # listing -> (etag, serialized body)
+
+def _registry_etag():
+    return f'"{_REGISTRY_EPOCH}-{REGISTRY_VERSION}"'
+
+def _not_modified(request, etag):
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+def _cached_json(key, etag, build):
+    cached = _RESPONSE_CACHE.get(key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
     else:
-        raise HTTPException(status_code=400, detail="Unknown CPP type")
+        body = json.dumps(build()).encode()
+        # Cache only if no op was applied while building, else the body may be newer than etag
+        if _registry_etag() == etag:
+            _RESPONSE_CACHE[key] = (etag, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+def _cpp_item(cpp_id, cpp):
+    return _cpp_json(cpp)
+
+def _node_item(node_id, node):
+    return {"node_id": node_id, **node}
+
+def _cpp_filter(cpp_type, target_ram, is_full, wallet):
+    wallet_nodes = set(NODES_BY_WALLET.get(wallet, ())) if wallet is not None else None
+
+    def match(cpp_id, cpp):
+        if cpp_type is not None and cpp["cpp_type"] != cpp_type:
+            return False
+        if target_ram is not None and cpp["target_ram"] != target_ram:
+            return False
+        if is_full is not None and (cpp["total_ram"] >= cpp["target_ram"]) != is_full:
+            return False
+        if wallet_nodes is not None and not any(
+            node_id in wallet_nodes for node_id in cpp["contributors"].node_ids()
+        ):
+            return False
+        return True
+    return match
 
 @app.get("/cpps")
-def list_cpp():
-    return CPPS
+def list_cpp(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cpp_type: Optional[CPPType] = None,
+    target_ram: Optional[int] = None,
+    is_full: Optional[bool] = None,
+    wallet: Optional[str] = None,
+    stream: bool = False,
+):
+    """
+    Without parameters returns every CPP keyed by cpp_id. Any of cursor, limit or a
+    filter switches to a page of {"items", "next_cursor"}; stream=true sends the
+    matching pools as NDJSON, one per line. Non-streamed responses carry an ETag.
+    """
+    _catch_up()
+    etag = _registry_etag()
+    if not stream and _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    filtered = any(v is not None for v in (cpp_type, target_ram, is_full, wallet))
+    if not stream and cursor is None and limit is None and not filtered:
+        return _cached_json("cpps", etag, lambda: {cpp_id: _cpp_json(cpp) for cpp_id, cpp in list(CPPS.items())})
+    response.headers["ETag"] = etag
+    rows = _scan(CPP_ORDER, CPPS, _parse_cursor(cursor),
+                 _cpp_filter(cpp_type, target_ram, is_full, wallet))
+    if stream:
+        return StreamingResponse(_ndjson(rows, limit, _cpp_item), media_type="application/x-ndjson")
+    return _page(rows, limit or DEFAULT_PAGE_SIZE, _cpp_item)
 
 @app.get("/nodes")
-def list_nodes():
-    return NODES
+def list_nodes(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    wallet: Optional[str] = None,
+    stream: bool = False,
+):
+    """Same conventions as GET /cpps; page items carry their node_id."""
+    _catch_up()
+    etag = _registry_etag()
+    if not stream and _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if not stream and cursor is None and limit is None and wallet is None:
+        return _cached_json("nodes", etag, lambda: dict(NODES))
+    response.headers["ETag"] = etag
+    if wallet is not None:
+        match = lambda node_id, node: node["wallet"] == wallet
+    else:
+        match = lambda node_id, node: True
+    rows = _scan(NODE_ORDER, NODES, _parse_cursor(cursor), match)
+    if stream:
+        return StreamingResponse(_ndjson(rows, limit, _node_item), media_type="application/x-ndjson")
+    return _page(rows, limit or DEFAULT_PAGE_SIZE, _node_item)
+
+@app.get("/stats")
+def capacity_stats(request: Request, response: Response):
+    """
+    Pools and pooled RAM per bundled target_ram (with open/full and fill-ratio
+    counts), isolated pools, total pooled RAM and GPU counts per model. Served
+    from running totals, so the cost does not grow with the registry.
+    """
+    _catch_up()
+    etag = _registry_etag()
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    stats = CAPACITY_STATS.snapshot()
+    stats.update(nodes=len(NODES), cpps=len(CPPS), contributing_nodes=len(CONTRIBUTIONS))
+    return stats
+
+# Live GPU telemetry reported by agents. Kept in memory only: each registered GPU
+# of a node gets a fixed-size ring buffer, so memory stays bounded however long
+# the node runs.
+TELEMETRY_FIELDS = ["util", "mem_used_mb", "sm_clock_mhz", "mem_clock_mhz"]
+TELEMETRY_BUFFER_SIZE = 720  # samples per GPU, one hour at the agent's default 5s sampling
+TELEMETRY = {}  # node_id -> {gpu_index: deque of (t_ms, *TELEMETRY_FIELDS)}
+
+class GPUTelemetry(BaseModel):
+    index: int
+    base: List[int]  # [t_ms, *TELEMETRY_FIELDS] of the first sample
+    deltas: List[List[int]] = []  # each later sample as differences from the previous one
+
+class TelemetryBatch(BaseModel):
+    node_id: str
+    gpus: List[GPUTelemetry]
+
+@app.post("/telemetry")
+def ingest_telemetry(batch: TelemetryBatch):
+    node = NODES.get(batch.node_id)
+    if node is None:
+        # Possibly registered through another worker
+        _catch_up()
+        node = NODES.get(batch.node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Unknown node_id")
+    width = len(TELEMETRY_FIELDS) + 1
+    registered = {gpu["index"] for gpu in node["gpus"]}
+    for series in batch.gpus:
+        if series.index not in registered:
+            raise HTTPException(status_code=400, detail=f"GPU {series.index} is not registered for this node")
+        if len(series.base) != width or any(len(delta) != width for delta in series.deltas):
+            raise HTTPException(status_code=400, detail=f"Telemetry rows must have {width} values")
+    touch_node(batch.node_id)
+    buffers = TELEMETRY.setdefault(batch.node_id, {})
+    samples = 0
+    for series in batch.gpus:
+        buffer = buffers.get(series.index)
+        if buffer is None:
+            buffer = buffers[series.index] = deque(maxlen=TELEMETRY_BUFFER_SIZE)
+        row = tuple(series.base)
+        buffer.append(row)
+        for delta in series.deltas:
+            row = tuple(value + change for value, change in zip(row, delta))
+            buffer.append(row)
+        samples += 1 + len(series.deltas)
+    # Lets the agent notice that it was expired or the registry was reset, and reconnect
+    return {"status": "ok", "samples": samples, "connected": batch.node_id in NODE_POOLS}
+
+class PowerReport(BaseModel):
+    node_id: str
+    gpus: Dict[int, int]  # GPU index -> effective percent
+
+@app.post("/power")
+def report_power(report: PowerReport):
+    """
+    Effective percent the agent currently dedicates on its "auto" GPUs. Stored on
+    the node's GPUs as "effective_percent"; agents only send it when it moved enough.
+    """
+    node = NODES.get(report.node_id)
+    if node is None:
+        _catch_up()
+        node = NODES.get(report.node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Unknown node_id")
+    auto = {gpu["index"] for gpu in node["gpus"] if gpu["percent"] == "auto"}
+    for index, percent in report.gpus.items():
+        if index not in auto:
+            raise HTTPException(status_code=400, detail=f"GPU {index} of this node is not set to 'auto'")
+        if not 0 <= percent <= 100:
+            raise HTTPException(status_code=400, detail="Effective percent must be 0-100")
+    _commit({
+        "op": "set_power",
+        "node_id": report.node_id,
+        "gpus": {str(index): percent for index, percent in report.gpus.items()}
+    })
+    touch_node(report.node_id)
+    return {"status": "ok"}
+
+@app.get("/telemetry/{node_id}")
+def get_telemetry(node_id: str, limit: Optional[int] = Query(None, ge=1, le=TELEMETRY_BUFFER_SIZE)):
+    """Most recent samples per GPU of a node, oldest first."""
+    if node_id not in NODES:
+        _catch_up()
+    if node_id not in NODES:
+        raise HTTPException(status_code=404, detail="Unknown node_id")
+    gpus = {}
+    for index, buffer in TELEMETRY.get(node_id, {}).items():
+        rows = list(buffer)
+        gpus[index] = rows[-limit:] if limit else rows
+    return {"fields": ["t_ms"] + TELEMETRY_FIELDS, "gpus": gpus}
+
+FEED_CATCH_UP_INTERVAL = 1.0
+
+def _feed_catch_up_loop(stop):
+    while not stop.wait(FEED_CATCH_UP_INTERVAL):
+        if len(FEED):
+            try:
+                _catch_up()
+            except Exception as e:
+                print(f"Change feed catch-up failed: {e}", file=sys.stderr)
+
+@app.get("/events")
+async def stream_events(request: Request, types: Optional[str] = None, last_event_id: Optional[str] = None):
+    """
+    Server-sent events for registry changes (EVENT_TYPES), optionally only the
+    comma-separated `types`. Each event's data carries its seq; reconnecting with
+    the Last-Event-ID header (or ?last_event_id=) resumes after that event.
+    """
+    wanted = None
+    if types:
+        wanted = {t.strip() for t in types.split(",")}
+        unknown = wanted.difference(EVENT_TYPES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+    resume = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        FEED.stream(resume, wanted), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Jobs run on pools that are ready for them: isolated pools, and bundled pools once
+# full. The scheduler is in-process, so jobs are off with a shared store: workers
+# would not see each other's jobs and would each fill every pool. SimulatedExecutor
+# stands in for a runtime until pools run real jobs.
+JOB_WAIT_SECONDS = METRICS.histogram(
+    "llmverse_job_wait_seconds", "Time jobs spent queued before they started.",
+    buckets=(0.01, 0.1, 1, 10, 60, 300, 900, 3600, 4 * 3600, 86400)
+)
+SCHEDULER = Scheduler(on_start=lambda job, wait: JOB_WAIT_SECONDS.observe(wait))
+JOB_EXECUTOR = SimulatedExecutor(SCHEDULER)
+
+def _job_counts():
+    stats = SCHEDULER.stats()
+    return [(("queued",), stats["queued"]), (("running",), stats["running"])]
+
+METRICS.gauge("llmverse_jobs", "Jobs by state.", _job_counts, ["state"])
+
+def _sync_job_capacity(cpp_id, cpp, removed=False):
+    capacity = 0
+    if not removed and (cpp["cpp_type"] != CPPType.bundled or cpp["total_ram"] >= cpp["target_ram"]):
+        capacity = cpp["total_ram"]
+    SCHEDULER.set_capacity(cpp_id, cpp["cpp_type"], capacity)
+
+def _check_jobs_enabled():
+    if _shared():
+        raise HTTPException(status_code=501, detail="Jobs are not available with a shared registry (LLMVERSE_SHARED=1)")
+
+class JobRequest(BaseModel):
+    ram_gb: int
+    priority: int = 0  # higher runs first
+    owner: Optional[str] = None  # jobs of different owners take turns within a priority
+    duration_s: float = 60.0  # how long the simulated executor runs the job
+    cpp_type: Optional[CPPType] = None  # restrict placement to one pool type
+
+@app.post("/jobs")
+def submit_job(req: JobRequest):
+    _check_jobs_enabled()
+    if req.ram_gb <= 0:
+        raise HTTPException(status_code=400, detail="ram_gb must be positive")
+    if req.duration_s <= 0:
+        raise HTTPException(status_code=400, detail="duration_s must be positive")
+    try:
+        job = SCHEDULER.submit(
+            req.ram_gb, priority=req.priority, owner=req.owner, duration_s=req.duration_s,
+            cpp_type=req.cpp_type.value if req.cpp_type is not None else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SCHEDULER.get(job.job_id)
+
+@app.get("/jobs/stats")
+def job_stats():
+    """Queue depth, running jobs, pool capacity offered to jobs and recent wait times."""
+    _check_jobs_enabled()
+    return SCHEDULER.stats()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    _check_jobs_enabled()
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return job
 
 # Placeholder: Replace with your project's Solana wallet address and private key for the feepool! These placeholders will be replaced with actual values in the production environment and should not be hardcoded in the codebase as they contain sensitive information.
 FEEPOOL_WALLET = "REPLACE_WITH_YOUR_PROJECT_SOLANA_WALLET"
@@ -179,46 +1621,149 @@ FEEPOOL_PRIVATE_KEY = "REPLACE_WITH_YOUR_PROJECT_SOLANA_PRIVATE_KEY"
 
 def get_total_contributions():
     """Return a dict mapping node_id to total RAM contributed across all pools."""
+    _catch_up()
+    return dict(CONTRIBUTIONS)
+
+def rebuild_contributions():
+    """Recompute the contribution ledger from scratch by walking every CPP."""
     contributions = {}
-    for cpp in CPPS.values():
-        for contributor in cpp["contributors"]:
-            node_id = contributor["node_id"]
-            ram = contributor["ram_contributed"]
+    for cpp in list(CPPS.values()):
+        contributors = cpp["contributors"]
+        for node_id, ram in zip(contributors.node_ids(), contributors.rams()):
             contributions[node_id] = contributions.get(node_id, 0) + ram
     return contributions
 
-def distribute_fees(total_fee_amount):
+def check_contributions(repair=False):
+    """
+    Diff the running ledger against one rebuilt from CPPS.
+    Returns {node_id: {"ledger": ..., "actual": ...}} for every mismatch; with
+    repair=True the running ledger is replaced by the rebuilt one.
+    """
+    _catch_up()
+    # Exclusive so the rebuild and the running ledger describe the same moment
+    with _GATE.exclusive():
+        actual = rebuild_contributions()
+        mismatches = {}
+        for node_id in CONTRIBUTIONS.keys() | actual.keys():
+            ledger_ram = CONTRIBUTIONS.get(node_id, 0)
+            actual_ram = actual.get(node_id, 0)
+            if ledger_ram != actual_ram:
+                mismatches[node_id] = {"ledger": ledger_ram, "actual": actual_ram}
+        if repair and mismatches:
+            CONTRIBUTIONS.clear()
+            CONTRIBUTIONS.update(actual)
+    return mismatches
+
+def check_capacity_stats():
+    """
+    Diff the running GET /stats totals against totals rebuilt from NODES and CPPS.
+    Returns {section: {"running": ..., "actual": ...}} for every section that differs.
+    """
+    _catch_up()
+    with _GATE.exclusive():
+        rebuilt = _CapacityStats()
+        for node in NODES.values():
+            rebuilt.add_node_gpus(node["gpus"])
+        for cpp in CPPS.values():
+            rebuilt.add_pool(cpp)
+            rebuilt.add_contributors(cpp["contributors"])
+        running, actual = CAPACITY_STATS.snapshot(), rebuilt.snapshot()
+    return {
+        section: {"running": running[section], "actual": actual[section]}
+        for section in running if running[section] != actual[section]
+    }
+
+PAYOUT_CHUNK_SIZE = 10000
+
+def wallet_contributions():
+    """
+    Aggregate the contribution ledger per wallet: returns (wallets, rams), two
+    parallel lists. RAM of nodes without a wallet is collected under None.
+    """
+    by_wallet = {}
+    for node_id, ram in get_total_contributions().items():
+        node = NODES.get(node_id)
+        wallet = (node["wallet"] if node else None) or None
+        by_wallet[wallet] = by_wallet.get(wallet, 0) + ram
+    return list(by_wallet), list(by_wallet.values())
+
+def split_fee(total_fee_amount, weights):
+    """
+    Split total_fee_amount (whole lamports) in proportion to `weights` with the
+    largest-remainder method: each entry gets floor(total * weight / sum), and the
+    lamports left over go one each to the entries with the largest remainders
+    (earlier entries win ties). The amounts always add up to total_fee_amount.
+    """
+    total_weight = sum(weights)
+    scaled = [total_fee_amount * weight for weight in weights]
+    amounts = [value // total_weight for value in scaled]
+    remainders = [value % total_weight for value in scaled]
+    leftover = total_fee_amount - sum(amounts)
+    # A heap only pays off while few entries get a lamport; otherwise sort once
+    if leftover * 8 < len(weights):
+        winners = heapq.nlargest(leftover, range(len(weights)), key=remainders.__getitem__)
+    else:
+        winners = sorted(range(len(weights)), key=remainders.__getitem__, reverse=True)[:leftover]
+    for i in winners:
+        amounts[i] += 1
+    return amounts
+
+def write_payout_plan(path, wallets, amounts, rams, chunk_size=PAYOUT_CHUNK_SIZE):
+    """Write one NDJSON line {"wallet", "amount", "ram"} per paying wallet, chunk_size lines per write."""
+    with open(path, "w") as f:
+        for start in range(0, len(wallets), chunk_size):
+            stop = start + chunk_size
+            f.write("".join(
+                '{"wallet": %s, "amount": %d, "ram": %d}\n' % (json.dumps(wallet), amount, ram)
+                for wallet, amount, ram in zip(wallets[start:stop], amounts[start:stop], rams[start:stop])
+                if wallet is not None and amount
+            ))
+
+def distribute_fees(total_fee_amount, plan_path=None):
     """
-    Distribute total_fee_amount (in lamports or SOL) from the feepool wallet
-    to all contributors, proportionally to their RAM contribution.
+    Distribute total_fee_amount (in lamports) from the feepool wallet to all
+    contributing wallets, proportionally to the RAM their nodes contributed.
+    Nodes sharing a wallet are paid once for their combined RAM; the share of
+    nodes without a wallet stays in the feepool ("undistributed").
     This should be run on the third of each month.
 
+    With plan_path the payout plan is streamed to that file as NDJSON instead of
+    being returned in "payouts".
+
     NOTE: This function is a stub. You must implement Solana transfer logic using
     FEEPOOL_WALLET and FEEPOOL_PRIVATE_KEY. Never commit your real private key to public repos.
     """
-    contributions = get_total_contributions()
-    total_ram = sum(contributions.values())
-    if total_ram == 0:
+    if int(total_fee_amount) != total_fee_amount or total_fee_amount < 0:
+        raise ValueError("total_fee_amount must be a non-negative whole number of lamports")
+    total_fee_amount = int(total_fee_amount)
+    wallets, rams = wallet_contributions()
+    if not sum(rams):
         return {"status": "no_contributions"}
-    payouts = {}
-    for node_id, ram in contributions.items():
-        node = NODES.get(node_id)
-        wallet = node["wallet"] if node else None
-        if not wallet:
-            continue
-        share = ram / total_ram
-        payout = int(total_fee_amount * share)
-        payouts[wallet] = payout
-        # Here you would send payout from FEEPOOL_WALLET to wallet using FEEPOOL_PRIVATE_KEY
-        # Example: solana_transfer(FEEPOOL_WALLET, FEEPOOL_PRIVATE_KEY, wallet, payout)
-    return {
+    amounts = split_fee(total_fee_amount, rams)
+    undistributed = 0
+    if None in wallets:
+        undistributed = amounts[wallets.index(None)]
+    result = {
         "status": "distributed",
         "total_fee": total_fee_amount,
-        "payouts": payouts,
+        "wallets": len(wallets) - (None in wallets),
+        "undistributed": undistributed,
+    }
+    # Here you would send each payout from FEEPOOL_WALLET to its wallet using FEEPOOL_PRIVATE_KEY
+    # Example: solana_transfer(FEEPOOL_WALLET, FEEPOOL_PRIVATE_KEY, wallet, amount)
+    if plan_path is not None:
+        write_payout_plan(plan_path, wallets, amounts, rams)
+        result["payout_plan"] = plan_path
+    else:
+        result["payouts"] = {
+            wallet: amount for wallet, amount in zip(wallets, amounts) if wallet is not None and amount
+        }
+    result.update({
         "feepool_wallet": FEEPOOL_WALLET,
         "note": (
             "FEEPOOL_WALLET and FEEPOOL_PRIVATE_KEY are placeholders. "
             "Replace them with your project's Solana wallet and private key. "
             "The private key is required for fee distribution."
         )
-    }
+    })
+    return result
@@ -0,0 +1,159 @@
+"""
+Load and latency benchmark for the backend API.
+
+Drives backend_api.app in process through httpx's ASGI transport, so no server
+or network is involved. For every registry size it pre-populates NODES / CPPS,
+then fires agent-shaped requests (built from agent_v1.get_gpus) at each endpoint
+and reports throughput and p50/p95/p99 latency:
+
+    python bench.py --sizes 1000,10000,100000 --requests 2000 --concurrency 16
+
+Bundled create_cpp calls are reported separately as joins of an open pool and
+creations of a new one, based on the status each response returns; the req/s of
+those two rows is their share of the bundled scenario's rate.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+import agent_v1
+import backend_api
+
+SCENARIOS = ["register_agent", "create_cpp_isolated", "create_cpp_bundled", "list_cpp", "list_cpp_page"]
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def summarize(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def agent_gpus():
+    """The agent's GPU list (mock data without NVML) with random dedicated percents."""
+    gpus = agent_v1.get_gpus()
+    percents = {gpu["index"]: random.randint(1, 100) for gpu in gpus}
+    return gpus, percents
+
+def populate(size, isolated_ratio=0.5):
+    """Reset the registry and grow it until it holds at least `size` pools."""
+    backend_api._reset_registry({}, {})
+    node_ids = []
+    while len(backend_api.CPPS) < size:
+        gpus, percents = agent_gpus()
+        wallet = f"wallet-{len(node_ids)}"
+        req = backend_api.RegisterRequest(**agent_v1._register_payload(wallet, gpus, percents))
+        node_id = backend_api.register_agent(req)["node_id"]
+        node_ids.append(node_id)
+        if random.random() < isolated_ratio:
+            payload = agent_v1._cpp_payload(node_id, gpus, percents, "isolated")
+        else:
+            target_ram = random.choice(backend_api.ALLOWED_BUNDLED_RAM_SIZES)
+            payload = agent_v1._cpp_payload(node_id, gpus, percents, "bundled", target_ram)
+        backend_api.create_cpp(backend_api.CPPCreateRequest(**payload))
+    return node_ids
+
+async def run_scenario(client, scenario, node_ids, requests, concurrency):
+    """Run `requests` calls of one scenario; returns {endpoint name: [latency seconds]}."""
+    latencies = {}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def call(i):
+        gpus, percents = agent_gpus()
+        if scenario == "register_agent":
+            resp = await client.post("/register_agent", json=agent_v1._register_payload(f"bench-{i}", gpus, percents))
+        elif scenario == "create_cpp_isolated":
+            payload = agent_v1._cpp_payload(random.choice(node_ids), gpus, percents, "isolated")
+            resp = await client.post("/create_cpp", json=payload)
+        elif scenario == "create_cpp_bundled":
+            target_ram = random.choice(backend_api.ALLOWED_BUNDLED_RAM_SIZES)
+            payload = agent_v1._cpp_payload(random.choice(node_ids), gpus, percents, "bundled", target_ram)
+            resp = await client.post("/create_cpp", json=payload)
+        elif scenario == "list_cpp":
+            resp = await client.get("/cpps")
+        else:
+            resp = await client.get("/cpps", params={"limit": backend_api.DEFAULT_PAGE_SIZE})
+        resp.raise_for_status()
+        if scenario == "create_cpp_bundled":
+            joined = resp.json()["status"] == "bundled_cpp_joined"
+            return "create_cpp_bundled_join" if joined else "create_cpp_bundled_create"
+        return scenario
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            name = await call(i)
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+async def bench_size(size, scenarios, requests, concurrency, list_requests):
+    node_ids = populate(size)
+    registry = {"pools": len(backend_api.CPPS), "nodes": len(backend_api.NODES)}
+    results = []
+    transport = httpx.ASGITransport(app=backend_api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for scenario in scenarios:
+            # Full listings are O(registry); keep their count separate so big sizes stay quick
+            count = list_requests if scenario == "list_cpp" else requests
+            start = time.perf_counter()
+            latencies = await run_scenario(client, scenario, node_ids, count, concurrency)
+            elapsed = time.perf_counter() - start
+            for name in sorted(latencies):
+                results.append(summarize(name, latencies[name], elapsed))
+    return registry, results
+
+def print_table(size, registry, results):
+    print(f"\nRegistry size {size}: {registry['pools']} pools, {registry['nodes']} nodes")
+    print(f"  {'endpoint':<28}{'requests':>9}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        print(f"  {r['endpoint']:<28}{r['requests']:>9}{r['throughput_rps']:>10.0f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LLMVerse backend in process.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated registry sizes (pools)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--list-requests", type=int, default=20, help="requests for the full GET /cpps scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON instead of tables")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    report = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        registry, results = asyncio.run(
+            bench_size(size, scenarios, args.requests, args.concurrency, args.list_requests)
+        )
+        report.append({"size": size, "registry": registry, "results": results})
+        if not args.json:
+            print_table(size, registry, results)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+In-process change feed streamed to clients as server-sent events.
+
+Events are serialized once, when they are published, and kept in a bounded ring
+buffer; every subscriber streams the same text. Event ids are "<epoch>-<seq>" so
+a client reconnecting with Last-Event-ID resumes right after the last event it
+saw. If the id is from another process lifetime or already fell out of the
+buffer, the client first gets a "resync" event telling it to refetch the state.
+
+publish() may be called from any thread; subscribers run on the event loop.
+"""
+
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+
+FEED_BUFFER_SIZE = 10000
+KEEPALIVE_SECONDS = 15.0
+
+
+class _Subscriber:
+    __slots__ = ("loop", "event", "notified")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.notified = False  # a wakeup is already scheduled on the loop
+
+
+class ChangeFeed:
+    def __init__(self, size=FEED_BUFFER_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.muted = False  # set while the registry is rebuilt wholesale
+        self._events = deque(maxlen=size)  # (seq, event type, SSE text)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _format(self, seq, event_type, data):
+        payload = json.dumps(dict(data, seq=seq))
+        return f"id: {self.epoch}-{seq}\nevent: {event_type}\ndata: {payload}\n\n"
+
+    def publish(self, event_type, data):
+        if self.muted:
+            return
+        with self._lock:
+            self.seq += 1
+            self._events.append((self.seq, event_type, self._format(self.seq, event_type, data)))
+            wake = [sub for sub in self._subscribers if not sub.notified]
+            for sub in wake:
+                sub.notified = True
+        for sub in wake:
+            sub.loop.call_soon_threadsafe(sub.event.set)
+
+    def _since(self, seq):
+        """(events after seq, oldest first; False if some of them were already dropped)."""
+        with self._lock:
+            events = []
+            for event in reversed(self._events):
+                if event[0] <= seq:
+                    break
+                events.append(event)
+            complete = not events or events[-1][0] == seq + 1
+        events.reverse()
+        return events, complete
+
+    def _resume_seq(self, last_event_id):
+        """Sequence number to resume after, or None if the id is not from this feed."""
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        return int(seq)
+
+    def _resync(self, seq, reason):
+        # Carries the current position as its id, so a reconnect resumes from here
+        return f"id: {self.epoch}-{seq}\nevent: resync\ndata: {json.dumps({'seq': seq, 'reason': reason})}\n\n"
+
+    async def stream(self, last_event_id=None, types=None, keepalive=KEEPALIVE_SECONDS):
+        """Async generator of SSE text: the events after last_event_id, then live ones. `types` filters by type."""
+        sub = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+            current = self.seq
+        try:
+            seq = self._resume_seq(last_event_id)
+            if seq is None:
+                seq = current
+                if last_event_id:
+                    yield self._resync(seq, "unknown_event_id")
+            while True:
+                sub.event.clear()
+                sub.notified = False
+                events, complete = self._since(seq)
+                if not complete:
+                    yield self._resync(events[0][0] - 1, "events_dropped")
+                for event_seq, event_type, text in events:
+                    seq = event_seq
+                    if types is None or event_type in types:
+                        yield text
+                try:
+                    await asyncio.wait_for(sub.event.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(sub)
@@ -0,0 +1,189 @@
+"""
+Minimal Prometheus-style metrics for the backend hot paths.
+
+Counters and histograms keep one value array per recording thread, so recording
+is a couple of list updates with no lock and no contention between threadpool
+workers. Arrays are only summed when the registry is rendered for a scrape.
+Gauges are computed on demand by callbacks at render time.
+"""
+
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadShards:
+    """Per-thread value arrays of a fixed width, summed on read."""
+
+    def __init__(self, width):
+        self._width = width
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()  # only taken the first time a thread records
+
+    def local(self):
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = self._local.values = [0] * self._width
+            with self._lock:
+                self._shards.append(values)
+        return values
+
+    def total(self):
+        with self._lock:
+            shards = list(self._shards)
+        total = [0] * self._width
+        for values in shards:
+            for i, value in enumerate(values):
+                total[i] += value
+        return total
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _ThreadShards(1)
+
+    def inc(self, amount=1):
+        self._shards.local()[0] += amount
+
+    def value(self):
+        return self._shards.total()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # one slot per bucket, one for +Inf, then the running sum
+        self._shards = _ThreadShards(len(buckets) + 2)
+
+    def observe(self, value):
+        values = self._shards.local()
+        values[bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self):
+        """Return (cumulative bucket counts incl. +Inf, count, sum)."""
+        values = self._shards.total()
+        cumulative = []
+        running = 0
+        for count in values[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, values[-1]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{self._label_text(values)} {child.value()}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        for values, child in list(self._children.items()):
+            cumulative, count, total = child.snapshot()
+            bounds = [_format(b) for b in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, cumulative):
+                yield f"{self.name}_bucket{self._label_text(values, [('le', bound)])} {bucket_count}"
+            yield f"{self.name}_count{self._label_text(values)} {count}"
+            yield f"{self.name}_sum{self._label_text(values)} {_format(total)}"
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are produced by `collect()` -> [(label values tuple, value)] at render time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def render(self):
+        for values, value in self._collect():
+            yield f"{self.name}{self._label_text(values)} {_format(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self.register(Gauge(name, documentation, collect, labelnames))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _format(value):
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,396 @@
+"""
+Durability for the backend registry (NODES / CPPS).
+
+Every mutation is appended to a write-ahead log before it is applied in memory.
+Every `snapshot_every` records the whole registry is written to a compacted
+snapshot and the log it supersedes is dropped, so recovery only has to load one
+snapshot and replay the short log tail that follows it. Snapshots are taken in
+two steps: begin_snapshot() marks the seq the caller's copy of the state is as
+of, and write_snapshot() can then run on another thread while appends go on.
+
+RegistryStore keeps the log as NDJSON files for a single process;
+SharedRegistryStore keeps it in SQLite so several worker processes can share it.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: SQLite's busy timeout does the waiting
+    fcntl = None
+
+SNAPSHOT_FILE = "registry_snapshot.json"
+LOG_FILE = "registry.log"
+ROTATED_LOG_FILE = "registry.log.1"  # log covered by a snapshot that is still being written
+
+
+class RegistryStore:
+    shared = False
+
+    def __init__(self, data_dir, snapshot_every=100000, fsync=False):
+        self.data_dir = data_dir
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+        self.log_path = os.path.join(data_dir, LOG_FILE)
+        self.rotated_path = os.path.join(data_dir, ROTATED_LOG_FILE)
+        self.seq = 0  # sequence number of the last durable record
+        self._since_snapshot = 0
+        self._log = None
+        self._lock = threading.Lock()  # guards the log file, seq and counters
+        self._local = threading.local()  # per-thread group commit depth
+        os.makedirs(data_dir, exist_ok=True)
+
+    def load(self):
+        """
+        Read the latest snapshot and the log records written after it.
+        Returns (state or None, records). A torn final line left by a crash is
+        cut off so new appends start on a clean record boundary.
+        """
+        state = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                state = json.load(f)
+            self.seq = state["seq"]
+        records = []
+        rotated = os.path.exists(self.rotated_path)
+        if rotated:
+            # A snapshot did not finish: its log still holds records the snapshot may not cover
+            self._read_log(self.rotated_path, records)
+        if os.path.exists(self.log_path):
+            good_offset = self._read_log(self.log_path, records)
+            if not rotated and good_offset != os.path.getsize(self.log_path):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good_offset)
+        if rotated:
+            self._rewrite_log(records)
+        self._since_snapshot = len(records)
+        self._log = open(self.log_path, "a")
+        return state, records
+
+    def _read_log(self, path, records):
+        """Add the records in `path` newer than self.seq to `records`; returns the offset after the last whole one."""
+        good_offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                good_offset += len(line)
+                # Records at or below the snapshot seq were already compacted
+                if record["seq"] > self.seq:
+                    records.append(record)
+                    self.seq = record["seq"]
+        return good_offset
+
+    def _rewrite_log(self, records):
+        """Replace the rotated log and the current one by a single log holding `records`."""
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        os.remove(self.rotated_path)
+
+    def append(self, records):
+        """
+        Log records (dicts), stamping each with the next sequence number. Safe to
+        call from many threads; records are durable on return unless the calling
+        thread is inside batch().
+        """
+        with self._lock:
+            lines = []
+            for record in records:
+                self.seq += 1
+                record["seq"] = self.seq
+                lines.append(json.dumps(record))
+            self._log.write("\n".join(lines) + "\n")
+            self._since_snapshot += len(records)
+        if not getattr(self._local, "depth", 0):
+            self._sync()
+
+    def _sync(self):
+        with self._lock:
+            self._log.flush()
+            fd = self._log.fileno()
+        # fsync outside the lock so concurrent committers share the disk flush
+        if self.fsync:
+            os.fsync(fd)
+
+    @contextmanager
+    def batch(self):
+        """
+        Group commit for the calling thread: records it appends inside the block are
+        flushed (and fsynced) once at the end. Callers can release their own locks
+        before the block exits, so the disk flush is not serialized behind them.
+        """
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            if not self._local.depth:
+                self._sync()
+
+    def needs_snapshot(self):
+        return self._since_snapshot >= self.snapshot_every
+
+    def begin_snapshot(self):
+        """
+        Start a snapshot of the state as of the last appended record, and return
+        that record's seq for write_snapshot(). The caller must keep appends out
+        while it copies the state and calls this. The log so far is set aside
+        until the snapshot is written; new records go to a fresh log.
+        """
+        with self._lock:
+            self._log.flush()
+            if self.fsync:
+                # Other threads' batches would only fsync the new log when they end
+                os.fsync(self._log.fileno())
+            self._log.close()
+            if os.path.exists(self.rotated_path):
+                # The previous snapshot was never written: keep its log, followed by this one
+                with open(self.log_path, "rb") as log, open(self.rotated_path, "ab") as rotated:
+                    shutil.copyfileobj(log, rotated)
+                    rotated.flush()
+                    os.fsync(rotated.fileno())
+                self._log = open(self.log_path, "w")
+            else:
+                os.replace(self.log_path, self.rotated_path)
+                self._log = open(self.log_path, "a")
+            self._since_snapshot = 0
+            return self.seq
+
+    def write_snapshot(self, state, seq, default=None):
+        """
+        Write `state`, as of `seq`, as the new snapshot and drop the log it
+        supersedes. Safe to run while other threads append. `default` is passed to
+        json.dumps for objects it cannot encode itself.
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(dict(state, seq=seq), default=default))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # A crash before this remove is harmless: load() skips records <= seq
+        os.remove(self.rotated_path)
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+SHARED_DB_FILE = "registry.db"
+
+
+class SharedRegistryStore:
+    """
+    Registry log shared by several worker processes through one SQLite database in
+    WAL mode. Each worker keeps its own in-memory copy of the registry and brings
+    it up to date by replaying the records other workers appended.
+
+    Mutations happen inside batch(), which holds the database write lock across
+    processes: the worker catches up, decides (e.g. which pool to join), appends
+    and commits without any other writer in between. Readers are never blocked.
+    """
+
+    shared = True
+
+    def __init__(self, data_dir, snapshot_every=100000, fsync=False):
+        self.data_dir = data_dir
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.path = os.path.join(data_dir, SHARED_DB_FILE)
+        self.seq = 0  # sequence number of the last record applied by this worker
+        self.needs_reload = False  # set when a failed transaction left applied records behind
+        self._local = threading.local()  # per-thread connection and batch depth
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # One writer per process waits on the database; the others wait here
+        self._write_lock = threading.Lock()
+        os.makedirs(data_dir, exist_ok=True)
+        self._lock_file = open(self.path + ".lock", "a") if fcntl is not None else None
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS ops (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS snapshot (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL, state TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS last_seen (node_id TEXT PRIMARY KEY, ts REAL NOT NULL);"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=" + ("FULL" if self.fsync else "NORMAL"))
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self):
+        """Return (state or None, records) as of one consistent read of the database."""
+        conn = self._conn()
+        # Inside batch() the write transaction already gives a consistent view
+        in_batch = getattr(self._local, "depth", 0)
+        if not in_batch:
+            conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT seq, state FROM snapshot WHERE id = 0").fetchone()
+            state = None
+            self.seq = 0
+            if row is not None:
+                self.seq, state = row[0], json.loads(row[1])
+            records = self._read_after(conn, self.seq)
+        finally:
+            if not in_batch:
+                conn.execute("COMMIT")
+        if records:
+            self.seq = records[-1]["seq"]
+        self.needs_reload = False
+        return state, records
+
+    def _read_after(self, conn, seq):
+        records = []
+        for row_seq, text in conn.execute("SELECT seq, record FROM ops WHERE seq > ? ORDER BY seq", (seq,)):
+            record = json.loads(text)
+            record["seq"] = row_seq
+            records.append(record)
+        return records
+
+    def catch_up(self):
+        """
+        Records appended by other workers since this worker's last one, advancing
+        self.seq past them. Returns None when a snapshot already compacted some of
+        them away; the caller must then load() from scratch.
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT seq FROM snapshot WHERE id = 0").fetchone()
+        if row is not None and row[0] > self.seq:
+            return None
+        records = self._read_after(conn, self.seq)
+        if records and records[0]["seq"] != self.seq + 1:
+            return None  # compacted between the two reads
+        if records:
+            self.seq = records[-1]["seq"]
+        return records
+
+    @contextmanager
+    def batch(self):
+        """
+        Write transaction for the calling thread, exclusive across every process
+        sharing the database. Nested blocks join the outermost one, which commits.
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        conn = self._conn()
+        with self._write_lock:
+            if self._lock_file is not None:
+                # Blocks until the other process is done, instead of SQLite's polling busy wait
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                self._local.depth = 1
+                self._local.appended = False
+                try:
+                    yield
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    if self._local.appended:
+                        self.needs_reload = True
+                    raise
+                else:
+                    conn.execute("COMMIT")
+                finally:
+                    self._local.depth = 0
+            finally:
+                if self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def append(self, records):
+        """Log records (dicts) in the calling thread's batch(), stamping each with its seq."""
+        if not getattr(self._local, "depth", 0):
+            raise RuntimeError("SharedRegistryStore.append needs an open batch()")
+        conn = self._conn()
+        for record in records:
+            cursor = conn.execute("INSERT INTO ops (record) VALUES (?)", (json.dumps(record),))
+            record["seq"] = self.seq = cursor.lastrowid
+        self._local.appended = True
+
+    def needs_snapshot(self):
+        row = self._conn().execute("SELECT seq FROM snapshot WHERE id = 0").fetchone()
+        return self.seq - (row[0] if row is not None else 0) >= self.snapshot_every
+
+    def begin_snapshot(self):
+        """The seq the caller's copy of the state is as of; see RegistryStore.begin_snapshot."""
+        return self.seq
+
+    def write_snapshot(self, state, seq, default=None):
+        """
+        Store `state`, as of `seq`, and drop the log records it covers. The state
+        is serialized before the write lock is taken; a snapshot another worker
+        stored meanwhile is kept if it is newer.
+        """
+        text = json.dumps(state, default=default)
+        with self.batch():
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO snapshot (id, seq, state) VALUES (0, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET seq = excluded.seq, state = excluded.state "
+                "WHERE excluded.seq > snapshot.seq",
+                (seq, text)
+            )
+            conn.execute("DELETE FROM ops WHERE seq <= (SELECT seq FROM snapshot WHERE id = 0)")
+
+    def record_seen(self, seen):
+        """Merge {node_id: timestamp} into the shared last-seen table, keeping the newest time."""
+        if not seen:
+            return
+        with self.batch():
+            self._conn().executemany(
+                "INSERT INTO last_seen (node_id, ts) VALUES (?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET ts = MAX(ts, excluded.ts)",
+                list(seen.items())
+            )
+
+    def last_seen(self, node_ids):
+        """{node_id: timestamp} from the shared last-seen table for the given nodes."""
+        conn = self._conn()
+        node_ids = list(node_ids)
+        result = {}
+        for start in range(0, len(node_ids), 500):
+            chunk = node_ids[start:start + 500]
+            query = "SELECT node_id, ts FROM last_seen WHERE node_id IN (%s)" % ",".join("?" * len(chunk))
+            result.update(conn.execute(query, chunk).fetchall())
+        return result
+
+    def forget_seen(self, node_ids):
+        with self.batch():
+            self._conn().executemany("DELETE FROM last_seen WHERE node_id = ?", [(n,) for n in node_ids])
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,484 @@
+"""
+Job queue and capacity-aware placement of jobs on CPPs.
+
+Pools announce how much RAM they offer to jobs with set_capacity(). Free capacity
+is indexed per CPP type in buckets of free GB, so placing a job is a bisect over
+the distinct free sizes instead of a scan over pools; the tightest fitting pool
+wins, which keeps big pools free for big jobs.
+
+Queued jobs are ordered by priority (higher first). Within a priority, owners
+take turns and each owner's jobs run in submission order, so one owner's burst
+cannot starve the others. A job that fits nowhere right now does not block smaller
+jobs behind it (backfill): each turn starts the owner's first job among the next
+BACKFILL_DEPTH that fits. Jobs bigger than every pool are refused at submit().
+
+There is no job runtime yet: SimulatedExecutor completes jobs after their
+duration_s, and simulate() replays a synthetic workload in virtual time:
+
+    python scheduler.py --pools 10000 --jobs 100000
+"""
+
+import argparse
+import heapq
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from itertools import islice
+
+FINISHED_JOBS_KEPT = 10000
+BACKFILL_DEPTH = 32  # queued jobs of one owner looked at per turn
+WAIT_WINDOW = 1000  # most recent waits used for the wait-time stats
+
+
+class FreeCapacityIndex:
+    """Pools with free capacity, bucketed by free GB."""
+
+    def __init__(self):
+        self._buckets = {}  # free GB -> {cpp_id: None}
+        self._sizes = []    # sorted free values that have a non-empty bucket
+
+    def add(self, cpp_id, free):
+        if free <= 0:
+            return
+        bucket = self._buckets.get(free)
+        if bucket is None:
+            bucket = self._buckets[free] = {}
+            insort(self._sizes, free)
+        bucket[cpp_id] = None
+
+    def remove(self, cpp_id, free):
+        bucket = self._buckets.get(free)
+        if bucket is None or cpp_id not in bucket:
+            return
+        del bucket[cpp_id]
+        if not bucket:
+            del self._buckets[free]
+            del self._sizes[bisect_left(self._sizes, free)]
+
+    def best_fit(self, ram):
+        """(cpp_id, free) of the pool with the least free capacity that still fits `ram`, or None."""
+        i = bisect_left(self._sizes, ram)
+        if i == len(self._sizes):
+            return None
+        free = self._sizes[i]
+        return next(iter(self._buckets[free])), free
+
+    def largest(self):
+        return self._sizes[-1] if self._sizes else 0
+
+    def clear(self):
+        self._buckets.clear()
+        self._sizes.clear()
+
+
+def _pool_kind(cpp_type):
+    return "isolated" if cpp_type == "isolated" else "bundled"
+
+
+class Job:
+    __slots__ = ("job_id", "ram_gb", "priority", "owner", "duration_s", "cpp_type", "state",
+                 "cpp_id", "submitted_at", "started_at", "finished_at")
+
+    def __init__(self, job_id, ram_gb, priority, owner, duration_s, cpp_type, submitted_at):
+        self.job_id = job_id
+        self.ram_gb = ram_gb
+        self.priority = priority
+        self.owner = owner
+        self.duration_s = duration_s
+        self.cpp_type = cpp_type
+        self.state = "queued"
+        self.cpp_id = None
+        self.submitted_at = submitted_at
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class JobQueue:
+    """Pending jobs: one level per priority, each a rotation of per-owner FIFO queues."""
+
+    def __init__(self):
+        self._levels = {}      # priority -> OrderedDict(owner -> deque of jobs)
+        self._priorities = []  # ascending
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def push(self, job, front=False):
+        level = self._levels.get(job.priority)
+        if level is None:
+            level = self._levels[job.priority] = OrderedDict()
+            insort(self._priorities, job.priority)
+        jobs = level.get(job.owner)
+        if jobs is None:
+            jobs = level[job.owner] = deque()
+        if front:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+        self._len += 1
+
+    def owner_queues(self):
+        """Every owner's jobs (oldest first), highest priority first, owners in turn order."""
+        queues = []
+        for priority in reversed(self._priorities):
+            queues.extend(self._levels[priority].values())
+        return queues
+
+    def pop(self, job):
+        """Take `job` out of its owner's queue; that owner goes to the back of the turn order."""
+        level = self._levels[job.priority]
+        jobs = level[job.owner]
+        if jobs[0] is job:
+            jobs.popleft()
+        else:
+            jobs.remove(job)
+        if jobs:
+            level.move_to_end(job.owner)
+        else:
+            del level[job.owner]
+            if not level:
+                del self._levels[job.priority]
+                self._priorities.remove(job.priority)
+        self._len -= 1
+
+    def depth_by_priority(self):
+        return {priority: sum(len(jobs) for jobs in self._levels[priority].values())
+                for priority in reversed(self._priorities)}
+
+
+class Scheduler:
+    """
+    Thread-safe job scheduler. `clock` supplies the time when a caller does not
+    pass `now`; `on_start(job, wait_seconds)` is called for every job started.
+    """
+
+    def __init__(self, clock=time.time, on_start=None):
+        self.clock = clock
+        self.on_start = on_start
+        self.wakeup = threading.Event()  # set when capacity or the queue changed
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._finished = deque()
+        self._queue = JobQueue()
+        self._capacity = {}    # cpp_id -> (cpp_type, GB offered to jobs)
+        self._capacities = {"isolated": [], "bundled": []}  # sorted GB offered, per index
+        self._used = {}        # cpp_id -> GB taken by running jobs
+        self._running_on = {}  # cpp_id -> {job_id: None}, oldest first
+        self._index = {"isolated": FreeCapacityIndex(), "bundled": FreeCapacityIndex()}
+        self._completions = []  # heap of (finish time, job_id)
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        self.submitted = 0
+        self.completed = 0
+        self.preempted = 0
+
+    def _free(self, cpp_id):
+        return self._capacity[cpp_id][1] - self._used.get(cpp_id, 0)
+
+    def _index_for(self, cpp_type):
+        return self._index[_pool_kind(cpp_type)]
+
+    def largest_pool(self, cpp_type=None):
+        """GB offered by the biggest pool (of `cpp_type`, if given); 0 without pools."""
+        with self._lock:
+            if cpp_type is not None:
+                capacities = self._capacities[_pool_kind(cpp_type)]
+                return capacities[-1] if capacities else 0
+            return max((capacities[-1] for capacities in self._capacities.values() if capacities), default=0)
+
+    def submit(self, ram_gb, priority=0, owner=None, duration_s=60.0, cpp_type=None, now=None):
+        """
+        Queue a job and try to start it right away. Returns the Job. Raises
+        ValueError if no pool could ever take it, as it would never leave the queue.
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            largest = self.largest_pool(cpp_type)
+            if ram_gb > largest:
+                raise ValueError(f"No pool offers {ram_gb} GB; the largest offers {largest} GB")
+            job = Job(str(uuid.uuid4()), ram_gb, priority, owner, duration_s, cpp_type, now)
+            self._jobs[job.job_id] = job
+            self._queue.push(job)
+            self.submitted += 1
+            self.schedule(now)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def set_capacity(self, cpp_id, cpp_type, capacity):
+        """
+        Set the GB of RAM a pool offers to jobs (0 removes it). If running jobs no
+        longer fit, the most recently started ones go back to the front of the queue.
+        """
+        with self._lock:
+            old = self._capacity.get(cpp_id)
+            if old is not None:
+                self._index_for(old[0]).remove(cpp_id, self._free(cpp_id))
+                if old == (cpp_type, capacity):
+                    self._index_for(cpp_type).add(cpp_id, self._free(cpp_id))
+                    return
+                capacities = self._capacities[_pool_kind(old[0])]
+                del capacities[bisect_left(capacities, old[1])]
+            if capacity > 0:
+                self._capacity[cpp_id] = (cpp_type, capacity)
+                insort(self._capacities[_pool_kind(cpp_type)], capacity)
+            else:
+                self._capacity.pop(cpp_id, None)
+            running = self._running_on.get(cpp_id, {})
+            while running and self._used.get(cpp_id, 0) > max(capacity, 0):
+                self._preempt(self._jobs[next(reversed(running))])
+            if capacity > 0:
+                self._index_for(cpp_type).add(cpp_id, self._free(cpp_id))
+            self.wakeup.set()
+
+    def retain_pools(self, cpp_ids):
+        """Forget every pool not in `cpp_ids`; jobs running on those go back to the queue."""
+        with self._lock:
+            for cpp_id in [cpp_id for cpp_id in self._capacity if cpp_id not in cpp_ids]:
+                self.set_capacity(cpp_id, self._capacity[cpp_id][0], 0)
+
+    def _preempt(self, job):
+        self._release(job)
+        job.state = "queued"
+        job.cpp_id = None
+        job.started_at = None
+        self._queue.push(job, front=True)
+        self.preempted += 1
+
+    def _release(self, job):
+        cpp_id = job.cpp_id
+        running = self._running_on[cpp_id]
+        del running[job.job_id]
+        if not running:
+            del self._running_on[cpp_id]
+        self._used[cpp_id] -= job.ram_gb
+        if not self._used[cpp_id]:
+            del self._used[cpp_id]
+
+    def _best_fit(self, job):
+        if job.cpp_type is not None:
+            fit = self._index_for(job.cpp_type).best_fit(job.ram_gb)
+            return fit and (fit, job.cpp_type)
+        fits = []
+        for cpp_type, index in self._index.items():
+            fit = index.best_fit(job.ram_gb)
+            if fit is not None:
+                fits.append((fit[1], fit, cpp_type))
+        if not fits:
+            return None
+        _, fit, cpp_type = min(fits)
+        return fit, cpp_type
+
+    def schedule(self, now=None):
+        """Start every queued job that fits somewhere. Returns the started jobs."""
+        now = self.clock() if now is None else now
+        started = []
+        with self._lock:
+            placed = True
+            while placed and len(self._queue):
+                # One round offers every owner, in fairness order, a slot for its first
+                # job that fits; owners whose job started get another in the next round.
+                placed = False
+                largest = max(index.largest() for index in self._index.values())
+                for jobs in self._queue.owner_queues():
+                    for job in islice(jobs, BACKFILL_DEPTH):
+                        # Only shrinks while the round places jobs, so skipping on it is safe
+                        if job.ram_gb <= largest:
+                            slot = self._best_fit(job)
+                            if slot is not None:
+                                break
+                    else:
+                        continue
+                    (cpp_id, free), cpp_type = slot
+                    index = self._index_for(cpp_type)
+                    index.remove(cpp_id, free)
+                    index.add(cpp_id, free - job.ram_gb)
+                    self._queue.pop(job)
+                    self._used[cpp_id] = self._used.get(cpp_id, 0) + job.ram_gb
+                    self._running_on.setdefault(cpp_id, {})[job.job_id] = None
+                    job.state = "running"
+                    job.cpp_id = cpp_id
+                    job.started_at = now
+                    heapq.heappush(self._completions, (now + job.duration_s, job.job_id))
+                    self._waits.append(now - job.submitted_at)
+                    if self.on_start is not None:
+                        self.on_start(job, now - job.submitted_at)
+                    started.append(job)
+                    placed = True
+        return started
+
+    def complete_due(self, now=None):
+        """Finish every running job whose duration has elapsed. Returns the finished jobs."""
+        now = self.clock() if now is None else now
+        finished = []
+        with self._lock:
+            while self._completions and self._completions[0][0] <= now:
+                finish_at, job_id = heapq.heappop(self._completions)
+                job = self._jobs.get(job_id)
+                # Entries of preempted jobs are stale: the job was restarted or is queued
+                if job is None or job.state != "running" or job.started_at + job.duration_s != finish_at:
+                    continue
+                cpp_id = job.cpp_id
+                capacity = self._capacity.get(cpp_id)
+                if capacity is not None:
+                    self._index_for(capacity[0]).remove(cpp_id, self._free(cpp_id))
+                self._release(job)
+                if capacity is not None:
+                    self._index_for(capacity[0]).add(cpp_id, self._free(cpp_id))
+                job.state = "completed"
+                job.finished_at = now
+                self.completed += 1
+                self._finished.append(job_id)
+                if len(self._finished) > FINISHED_JOBS_KEPT:
+                    self._jobs.pop(self._finished.popleft(), None)
+                finished.append(job)
+        return finished
+
+    def next_completion(self):
+        with self._lock:
+            return self._completions[0][0] if self._completions else None
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            total = sum(capacity for _, capacity in self._capacity.values())
+            used = sum(self._used.values())
+            return {
+                "queued": len(self._queue),
+                "queued_by_priority": self._queue.depth_by_priority(),
+                "running": sum(len(jobs) for jobs in self._running_on.values()),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "preempted": self.preempted,
+                "pools": len(self._capacity),
+                "capacity_gb": total,
+                "used_gb": used,
+                "wait_seconds": {
+                    "samples": len(waits),
+                    "mean": sum(waits) / len(waits) if waits else 0.0,
+                    "p50": _percentile(waits, 50),
+                    "p95": _percentile(waits, 95),
+                    "max": waits[-1] if waits else 0.0,
+                },
+            }
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100.0 * len(sorted_values)))]
+
+
+class SimulatedExecutor:
+    """
+    Stand-in for a GPU runtime: a background thread that completes running jobs
+    once their duration_s has passed and starts queued jobs into the freed room.
+    """
+
+    def __init__(self, scheduler, max_wait=1.0):
+        self.scheduler = scheduler
+        self.max_wait = max_wait
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job-executor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.scheduler.wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        scheduler = self.scheduler
+        while not self._stop.is_set():
+            scheduler.wakeup.clear()
+            now = scheduler.clock()
+            scheduler.complete_due(now)
+            scheduler.schedule(now)
+            next_completion = scheduler.next_completion()
+            wait = self.max_wait if next_completion is None else min(self.max_wait, max(0.0, next_completion - now))
+            scheduler.wakeup.wait(wait)
+
+
+def simulate(pools, jobs, seed=0, arrival_rate=None, owners=100, priorities=3):
+    """
+    Run a synthetic workload through a Scheduler in virtual time: `pools` pools of
+    10-500 GB, and `jobs` jobs of 1-200 GB lasting 10-600 s arriving as a Poisson
+    process (by default fast enough to keep the pools about busy). Returns the
+    scheduler stats plus makespan and wall-clock scheduling throughput.
+    """
+    rng = random.Random(seed)
+    clock = [0.0]
+    scheduler = Scheduler(clock=lambda: clock[0])
+    capacity = 0
+    for i in range(pools):
+        size = rng.choice([10, 24, 48, 80, 100, 200, 500])
+        scheduler.set_capacity(f"cpp-{i}", "isolated" if size < 100 else "bundled", size)
+        capacity += size
+    if arrival_rate is None:
+        # mean job: ~100 GB for ~300 s, so this rate roughly fills the pools
+        arrival_rate = capacity / (100.0 * 300.0)
+    started = time.perf_counter()
+    arrival = 0.0
+    for _ in range(jobs):
+        arrival += rng.expovariate(arrival_rate)
+        # Let completions that happen before this arrival free their room first
+        while True:
+            next_completion = scheduler.next_completion()
+            if next_completion is None or next_completion > arrival:
+                break
+            clock[0] = next_completion
+            scheduler.complete_due()
+            scheduler.schedule()
+        clock[0] = arrival
+        scheduler.submit(
+            ram_gb=rng.randint(1, 200),
+            priority=rng.randrange(priorities),
+            owner=f"owner-{rng.randrange(owners)}",
+            duration_s=rng.uniform(10, 600),
+        )
+    while scheduler.next_completion() is not None:
+        clock[0] = scheduler.next_completion()
+        scheduler.complete_due()
+        scheduler.schedule()
+    elapsed = time.perf_counter() - started
+    stats = scheduler.stats()
+    stats["makespan_s"] = clock[0]
+    stats["wall_s"] = elapsed
+    stats["jobs_per_wall_s"] = jobs / elapsed if elapsed else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the job scheduler without GPUs.")
+    parser.add_argument("--pools", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--owners", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    stats = simulate(args.pools, args.jobs, seed=args.seed, owners=args.owners)
+    waits = stats["wait_seconds"]
+    print(f"{args.jobs} jobs on {stats['pools']} pools ({stats['capacity_gb']} GB)")
+    print(f"  completed {stats['completed']}, makespan {stats['makespan_s']:.0f}s simulated")
+    print(f"  wait (last {waits['samples']}): mean {waits['mean']:.1f}s, p50 {waits['p50']:.1f}s, "
+          f"p95 {waits['p95']:.1f}s, max {waits['max']:.1f}s")
+    print(f"  scheduler throughput {stats['jobs_per_wall_s']:.0f} jobs/s ({stats['wall_s']:.2f}s wall)")
+
+
+if __name__ == "__main__":
+    main()
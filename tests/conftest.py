@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend_api
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    """Every test starts from an empty, memory-only registry."""
+    backend_api.close_registry()
+    backend_api._reset_registry({}, {})
+    yield
+    backend_api.close_registry()
+    backend_api._reset_registry({}, {})
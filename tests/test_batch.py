@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+
+import backend_api as b
+
+client = TestClient(b.app)
+GPU = {"index": 0, "name": "A", "memory_gb": 24, "frequency": "1", "percent": "100"}
+
+
+def test_register_agents_reports_invalid_items_in_place():
+    response = client.post("/register_agents", json={"agents": [
+        {"wallet": "w1", "gpus": [GPU]},
+        {"wallet": "w2", "gpus": [dict(GPU, percent="abc")]},
+        5,
+        {"wallet": "w3", "gpus": [GPU]},
+        {"gpus": []},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["registered", "error", "error", "registered", "error"]
+    assert results[1]["status_code"] == 422
+    assert [e["loc"] for e in results[1]["detail"]] == [["gpus", 0, "percent"]]
+    assert [e["type"] for e in results[2]["detail"]] == ["model_type"]
+    assert [e["loc"] for e in results[4]["detail"]] == [["wallet"]]
+    assert len(b.NODES) == 2
+
+
+def test_create_cpps_mixes_validation_and_request_errors():
+    node_id = client.post("/register_agent", json={"wallet": "w", "gpus": [GPU]}).json()["node_id"]
+    results = client.post("/create_cpps", json={"pools": [
+        {"node_id": node_id, "gpus": "not a list"},
+        {"node_id": node_id, "gpus": [GPU], "cpp_type": "bundled", "target_ram": 7},
+        {"node_id": node_id, "gpus": [GPU], "cpp_type": "isolated"},
+    ]}).json()["results"]
+    assert [(r["status"], r.get("status_code")) for r in results] == [
+        ("error", 422), ("error", 400), ("isolated_cpp_created", None)]
+    assert len(b.CPPS) == 1
+
+
+def test_batch_bodies_keep_their_item_schema():
+    schemas = client.get("/openapi.json").json()["components"]["schemas"]
+    agents = schemas["BatchRegisterRequest"]["properties"]["agents"]["items"]
+    assert agents["title"] == "RegisterRequest"
+    assert "gpus" in agents["properties"]
+    assert client.post("/register_agents", json={"agents": "nope"}).status_code == 422
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import threading
+
+from change_feed import ChangeFeed
+
+
+def parse(text):
+    """(id, event, data) of one SSE message."""
+    fields = dict(line.split(": ", 1) for line in text.strip().split("\n"))
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+def read(feed, count, last_event_id=None, types=None, keepalive=5):
+    """First `count` messages of a subscription, then closes it."""
+    async def run():
+        stream = feed.stream(last_event_id, types, keepalive=keepalive)
+        try:
+            return [await asyncio.wait_for(stream.__anext__(), 5) for _ in range(count)]
+        finally:
+            await stream.aclose()
+    return asyncio.run(run())
+
+
+def publish(feed, count, event_type="node_updated"):
+    for i in range(count):
+        feed.publish(event_type, {"i": i})
+
+
+def test_resume_after_last_event_id():
+    feed = ChangeFeed()
+    publish(feed, 5)
+    messages = [parse(text) for text in read(feed, 3, f"{feed.epoch}-2")]
+    assert [m[0] for m in messages] == [f"{feed.epoch}-{seq}" for seq in (3, 4, 5)]
+    assert [m[2] for m in messages] == [{"i": i, "seq": i + 1} for i in (2, 3, 4)]
+    assert len(feed) == 0
+
+
+def test_resume_skips_filtered_types_but_keeps_position():
+    feed = ChangeFeed()
+    publish(feed, 2, "node_updated")
+    publish(feed, 2, "pool_full")
+    messages = [parse(text) for text in read(feed, 2, f"{feed.epoch}-0", types={"pool_full"})]
+    assert [(m[1], m[2]["seq"]) for m in messages] == [("pool_full", 3), ("pool_full", 4)]
+
+
+def test_unknown_event_id_asks_for_resync():
+    feed = ChangeFeed()
+    publish(feed, 3)
+    for last_event_id in ("other-1", f"{feed.epoch}-99", f"{feed.epoch}-x", "garbage"):
+        _, event, data = parse(read(feed, 1, last_event_id)[0])
+        assert (event, data) == ("resync", {"seq": 3, "reason": "unknown_event_id"}), last_event_id
+    # Without an id the stream starts at the live end, no resync
+    assert read(feed, 1, keepalive=0.01) == [": keepalive\n\n"]
+
+
+def test_dropped_events_ask_for_resync_then_continue():
+    feed = ChangeFeed(size=3)
+    publish(feed, 6)
+    messages = [parse(text) for text in read(feed, 4, f"{feed.epoch}-1")]
+    # Events 2 and 3 fell out of the buffer; the resync's id is right before the oldest kept one
+    assert messages[0] == (f"{feed.epoch}-3", "resync", {"seq": 3, "reason": "events_dropped"})
+    assert [m[2]["seq"] for m in messages[1:]] == [4, 5, 6]
+
+
+def test_live_events_published_from_another_thread():
+    feed = ChangeFeed()
+    publish(feed, 1)
+
+    async def run():
+        stream = feed.stream(f"{feed.epoch}-1", keepalive=5)
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        thread = threading.Thread(target=publish, args=(feed, 2))
+        thread.start()
+        first = await asyncio.wait_for(pending, 5)
+        second = await asyncio.wait_for(stream.__anext__(), 5)
+        thread.join()
+        await stream.aclose()
+        return [first, second]
+    assert [parse(text)[2]["seq"] for text in asyncio.run(run())] == [2, 3]
+    assert len(feed) == 0
+
+
+def test_muted_feed_publishes_nothing():
+    feed = ChangeFeed()
+    feed.muted = True
+    publish(feed, 3)
+    feed.muted = False
+    assert feed.seq == 0
+    _, event, data = parse(read(feed, 1, f"{feed.epoch}-5")[0])
+    assert (event, data["reason"]) == ("resync", "unknown_event_id")
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+import backend_api as b
+
+ROWS = [["n1", 0, "A", 24, "1", "100", 24], ["n2", 1, "B", 13, "2", "auto", 13], ["n1", 2, "A", 24, "1", "100", 20]]
+
+
+def test_columns_round_trip_rows_and_records():
+    columns = b.ContributorColumns(ROWS)
+    assert len(columns) == 3
+    assert columns.to_rows() == ROWS
+    assert [c.to_row() for c in columns] == ROWS
+    assert columns[-1].to_row() == ROWS[-1]
+    with pytest.raises(IndexError):
+        columns[3]
+    assert columns.node_ids() == ["n1", "n2", "n1"]
+    assert list(columns.rams()) == [24, 13, 20]
+    assert columns.to_dicts() == [b.ContributorRecord.from_row(row).to_dict() for row in ROWS]
+
+
+def test_columns_accept_legacy_contributor_dicts():
+    legacy = [b.ContributorRecord.from_row(row).to_dict() for row in ROWS]
+    assert b.ContributorColumns(legacy).to_rows() == ROWS
+
+
+def test_copies_do_not_see_later_rows():
+    columns = b.ContributorColumns(ROWS[:2])
+    copy = columns.copy()
+    columns.append(b.ContributorRecord.from_row(ROWS[2]))
+    assert copy.to_rows() == ROWS[:2]
+    assert json.loads(json.dumps(columns, default=b._json_default)) == ROWS
+
+
+def test_rows_share_node_ids_and_gpu_specs():
+    first = b.ContributorColumns([["".join(["n", "1"]), 0, "".join(["A"]), 24, "1", "100", 24]])
+    second = b.ContributorColumns([["".join(["n", "1"]), 1, "".join(["A"]), 24, "1", "100", 24]])
+    assert first.node_ids()[0] is second.node_ids()[0]
+    assert first._refs[1] is second._refs[1]
@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+
+import backend_api as b
+
+client = TestClient(b.app)
+
+
+def gpu(index, memory_gb=24, percent="100"):
+    return {"index": index, "name": "A", "memory_gb": memory_gb, "frequency": "1", "percent": percent}
+
+
+def etags():
+    return {path: client.get(path).headers["ETag"] for path in ("/cpps", "/nodes", "/stats")}
+
+
+def assert_changed(before):
+    after = etags()
+    for path in before:
+        assert after[path] != before[path], path
+    return after
+
+
+def test_matching_if_none_match_is_not_modified():
+    client.post("/register_agent", json={"wallet": "w", "gpus": [gpu(0)]})
+    for path in ("/cpps", "/nodes", "/stats"):
+        first = client.get(path)
+        etag = first.headers["ETag"]
+        for header in (etag, "W/" + etag, "*", f'"other", {etag}'):
+            cached = client.get(path, headers={"If-None-Match": header})
+            assert cached.status_code == 304, (path, header)
+            assert cached.headers["ETag"] == etag
+            assert cached.content == b""
+        stale = client.get(path, headers={"If-None-Match": '"stale"'})
+        assert stale.status_code == 200
+        assert stale.json() == first.json()
+
+
+def test_every_mutating_op_changes_the_etag():
+    before = etags()
+    node_id = client.post("/register_agent", json={"wallet": "w", "gpus": [gpu(0, percent="auto")]}).json()["node_id"]
+    before = assert_changed(before)
+
+    create = {"node_id": node_id, "gpus": [gpu(0, percent="auto")], "cpp_type": "bundled", "target_ram": 100}
+    cpp_id = client.post("/create_cpp", json=create).json()["cpp_id"]
+    before = assert_changed(before)
+
+    other = client.post("/register_agent", json={"wallet": "v", "gpus": [gpu(0)]}).json()["node_id"]
+    before = assert_changed(before)
+    joined = client.post("/create_cpp", json=dict(create, node_id=other, gpus=[gpu(0)])).json()
+    assert joined == dict(joined, cpp_id=cpp_id, status="bundled_cpp_joined")
+    before = assert_changed(before)
+
+    assert client.post("/power", json={"node_id": node_id, "gpus": {"0": 40}}).json() == {"status": "ok"}
+    before = assert_changed(before)
+
+    b._withdraw_node(other)
+    assert other not in b.NODE_POOLS
+    assert_changed(before)
+
+
+def test_reads_and_rejected_writes_keep_the_etag():
+    node_id = client.post("/register_agent", json={"wallet": "w", "gpus": [gpu(0)]}).json()["node_id"]
+    before = etags()
+    client.get("/cpps", params={"limit": 1})
+    # GPU 0 is not set to "auto", so nothing is committed
+    assert client.post("/power", json={"node_id": node_id, "gpus": {"0": 40}}).status_code == 400
+    assert etags() == before
+
+
+def test_reset_registry_changes_the_epoch():
+    client.post("/register_agent", json={"wallet": "w", "gpus": [gpu(0)]})
+    etag = client.get("/nodes").headers["ETag"]
+    epoch, version = etag.strip('"').split("-")
+    b._reset_registry({}, {})
+    fresh = client.get("/nodes", headers={"If-None-Match": etag})
+    # A restored or wiped registry may reuse version numbers, the epoch keeps old ETags from matching
+    assert fresh.status_code == 200
+    assert fresh.json() == {}
+    assert fresh.headers["ETag"].strip('"').split("-")[0] != epoch
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+import backend_api as b
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(b.time, "time", lambda: now[0])
+    return now
+
+
+def gpu(index, memory_gb):
+    return b.GPUInfo(index=index, name="A", memory_gb=memory_gb, frequency="1", percent="100")
+
+
+def join_bundled(wallet, memory_gb, target_ram=100):
+    node_id = b.register_agent(b.RegisterRequest(wallet=wallet, gpus=[gpu(0, memory_gb)]))["node_id"]
+    result = b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0, memory_gb)], cpp_type="bundled",
+                                             target_ram=target_ram))
+    return node_id, result
+
+
+def test_expired_node_reopens_its_pool_for_new_joins(clock):
+    gone, created = join_bundled("a", 60)
+    alive, joined = join_bundled("b", 40)
+    cpp_id = created["cpp_id"]
+    assert joined == {"cpp_id": cpp_id, "status": "bundled_cpp_joined", "is_full": True,
+                      "total_ram": 100, "target_ram": 100}
+    assert len(b.OPEN_BUNDLED_POOLS[100]) == 0
+
+    clock[0] += b.NODE_TTL / 2
+    b.touch_node(alive)
+    clock[0] += b.NODE_TTL / 2 + 1
+    assert b.expire_nodes() == [gone]
+    assert b.CPPS[cpp_id]["total_ram"] == 40
+    assert b.OPEN_BUNDLED_POOLS[100].best_fit(60) == cpp_id
+
+    _, refilled = join_bundled("c", 60)
+    assert refilled["cpp_id"] == cpp_id
+    assert refilled["status"] == "bundled_cpp_joined"
+    assert refilled["is_full"]
+
+
+def test_node_touched_after_it_was_popped_is_kept(clock, monkeypatch):
+    node_id, created = join_bundled("a", 60)
+    pop_expired, touch_node = b._pop_expired, b.touch_node
+    touching, sweep_done = threading.Event(), threading.Event()
+
+    def slow_touch(node_id, now=None):
+        touching.set()
+        # Holds create_cpp here; a sweep that could run meanwhile would withdraw the new pool
+        sweep_done.wait(0.5)
+        touch_node(node_id, now)
+
+    def pop_then_create(now):
+        candidates = pop_expired(now)
+        # The agent calls back between the sweep picking the node and withdrawing it
+        monkeypatch.setattr(b, "touch_node", slow_touch)
+        agent = threading.Thread(target=b.create_cpp, args=(b.CPPCreateRequest(
+            node_id=node_id, gpus=[gpu(0, 60)], cpp_type="bundled", target_ram=100),))
+        agent.start()
+        touching.wait(5)
+        threads.append(agent)
+        return candidates
+
+    threads = []
+    clock[0] += b.NODE_TTL + 1
+    monkeypatch.setattr(b, "_pop_expired", pop_then_create)
+    assert b.expire_nodes() == []
+    sweep_done.set()
+    threads[0].join()
+    assert b.NODE_POOLS[node_id] == {created["cpp_id"]: None}
+
+    # The touch rescheduled the node, so it still expires once it goes quiet
+    monkeypatch.setattr(b, "_pop_expired", pop_expired)
+    clock[0] += b.NODE_TTL + 1
+    assert b.expire_nodes() == [node_id]
+
+
+def test_ledger_stays_consistent_after_expiry(clock):
+    nodes = [join_bundled(f"w{i}", memory_gb)[0] for i, memory_gb in enumerate([24, 40, 13, 60, 7, 24])]
+    isolated = b.register_agent(b.RegisterRequest(wallet="iso", gpus=[gpu(0, 24), gpu(1, 13)]))["node_id"]
+    b.create_cpp(b.CPPCreateRequest(node_id=isolated, gpus=[gpu(0, 24), gpu(1, 13)], cpp_type="isolated"))
+
+    clock[0] += b.NODE_TTL / 2
+    for node_id in nodes[::2]:
+        b.touch_node(node_id)
+    clock[0] += b.NODE_TTL / 2 + 1
+    expired = b.expire_nodes()
+    assert sorted(expired) == sorted(nodes[1::2] + [isolated])
+    assert b.check_contributions() == {}
+    assert b.check_capacity_stats() == {}
+    assert set(b.CONTRIBUTIONS) == set(nodes[::2])
+    assert not set(expired) & set(b.NODE_POOLS)
+    assert all(c.node_id not in expired for cpp in b.CPPS.values() for c in cpp["contributors"])
+    # Nodes stay registered; only their contributions are withdrawn
+    assert set(expired) <= set(b.NODES)
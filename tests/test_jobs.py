@@ -0,0 +1,26 @@
+from fastapi.testclient import TestClient
+
+import backend_api as b
+
+client = TestClient(b.app)
+
+
+def test_jobs_are_rejected_with_a_shared_store(tmp_path):
+    b.open_registry(str(tmp_path), shared=True)
+    assert client.post("/jobs", json={"ram_gb": 10}).status_code == 501
+    assert client.get("/jobs/stats").status_code == 501
+    assert client.get("/jobs/some-job").status_code == 501
+
+
+def test_jobs_are_placed_on_pools():
+    gpu = {"index": 0, "name": "A", "memory_gb": 24, "frequency": "1", "percent": "100"}
+    node_id = client.post("/register_agent", json={"wallet": "w", "gpus": [gpu]}).json()["node_id"]
+    cpp_id = client.post("/create_cpp", json={"node_id": node_id, "gpus": [gpu]}).json()["cpp_ids"][0]
+
+    response = client.post("/jobs", json={"ram_gb": 10})
+    assert response.status_code == 200
+    job = client.get(f"/jobs/{response.json()['job_id']}").json()
+    assert (job["state"], job["cpp_id"]) == ("running", cpp_id)
+    # Bigger than any pool: it could never leave the queue
+    assert client.post("/jobs", json={"ram_gb": 25}).status_code == 400
+    assert client.post("/jobs", json={"ram_gb": 10, "cpp_type": "bundled"}).status_code == 400
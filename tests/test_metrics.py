@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import backend_api as b
+
+
+def call(app, path):
+    """Runs `app` behind _LatencyMiddleware; returns the messages sent and the route's (count, sum)."""
+    scope = {"type": "http", "method": "GET", "route": SimpleNamespace(path=path)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    try:
+        asyncio.run(b._LatencyMiddleware(app)(scope, receive, send))
+    finally:
+        _, count, total = b.REQUEST_LATENCY.labels("GET", path).snapshot()
+    return sent, count, total
+
+
+def test_streams_are_timed_to_their_response_start():
+    async def stream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        # A long-lived stream: the client stays connected well past the headers
+        await asyncio.sleep(0.3)
+        await send({"type": "http.response.body", "body": b"data", "more_body": False})
+
+    sent, count, total = call(stream, "/test/stream")
+    assert [m["type"] for m in sent] == ["http.response.start", "http.response.body"]
+    assert count == 1
+    assert total < 0.2
+
+
+def test_requests_that_fail_before_responding_are_timed():
+    async def failing(scope, receive, send):
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        call(failing, "/test/failing")
+    _, count, total = b.REQUEST_LATENCY.labels("GET", "/test/failing").snapshot()
+    assert count == 1
+    assert total >= 0.05
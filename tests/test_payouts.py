@@ -0,0 +1,31 @@
+import random
+
+from backend_api import split_fee
+
+
+def test_split_fee_adds_up_to_the_fee():
+    rng = random.Random(13)
+    for _ in range(500):
+        weights = [rng.randint(0, 1000) for _ in range(rng.randint(1, 50))]
+        weights[rng.randrange(len(weights))] += 1
+        fee = rng.randint(0, 10 ** 12)
+        amounts = split_fee(fee, weights)
+        assert sum(amounts) == fee
+        total = sum(weights)
+        for amount, weight in zip(amounts, weights):
+            # Largest remainder: each entry is its exact share rounded down or up
+            assert fee * weight // total <= amount <= fee * weight // total + 1
+
+
+def test_split_fee_earlier_entries_win_ties():
+    assert split_fee(2, [1, 1, 1]) == [1, 1, 0]
+    assert split_fee(1, [5, 5]) == [1, 0]
+    assert split_fee(1, [1, 3, 3]) == [0, 1, 0]
+    # Many ties and few leftover lamports (the heap path) still favour the earliest
+    assert split_fee(3, [1] * 100) == [1, 1, 1] + [0] * 97
+
+
+def test_split_fee_exact_shares():
+    assert split_fee(10, [1, 4]) == [2, 8]
+    assert split_fee(0, [1, 2, 3]) == [0, 0, 0]
+    assert split_fee(7, [0, 1]) == [0, 7]
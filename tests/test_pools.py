@@ -0,0 +1,82 @@
+import random
+import sys
+import threading
+
+import backend_api as b
+
+
+def gpu(index, memory_gb):
+    return b.GPUInfo(index=index, name="A", memory_gb=memory_gb, frequency="1", percent="100")
+
+
+def open_pool_ids(target_ram):
+    return {cpp_id for bucket in b.OPEN_BUNDLED_POOLS[target_ram]._buckets.values() for cpp_id in bucket}
+
+
+def test_concurrent_bundled_joins_and_withdraws(monkeypatch):
+    joins = []
+    full_joins = []
+    apply_join = b._APPLIERS["join_cpp"]
+
+    def checked_join(op):
+        cpp = b.CPPS[op["cpp_id"]]
+        if cpp["total_ram"] >= cpp["target_ram"]:
+            full_joins.append(op["cpp_id"])
+        joins.append(op["cpp_id"])
+        apply_join(op)
+
+    monkeypatch.setitem(b._APPLIERS, "join_cpp", checked_join)
+    gpus = [gpu(i, memory_gb) for i, memory_gb in enumerate([7, 13, 24, 40])]
+    nodes = [b.register_agent(b.RegisterRequest(wallet=f"w{i}", gpus=gpus))["node_id"] for i in range(40)]
+    errors = []
+
+    def work(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(300):
+                node_id = rng.choice(nodes)
+                if rng.random() < 0.2:
+                    with b._group_commit(), b._NODE_LOCKS[hash(node_id) % len(b._NODE_LOCKS)]:
+                        b._withdraw_node(node_id)
+                else:
+                    b.create_cpp(b.CPPCreateRequest(
+                        node_id=node_id, gpus=rng.sample(gpus, rng.randint(1, 3)), cpp_type="bundled",
+                        target_ram=rng.choice(b.ALLOWED_BUNDLED_RAM_SIZES)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+    # Switch threads often, so unlocked check-then-act windows would interleave
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+    assert joins
+    assert full_joins == []
+    assert b.check_contributions() == {}
+    assert b.check_capacity_stats() == {}
+    for size in b.ALLOWED_BUNDLED_RAM_SIZES:
+        pools = {cpp_id: cpp for cpp_id, cpp in b.CPPS.items() if cpp["target_ram"] == size}
+        assert b.BUNDLED_POOL_COUNTS[size] == len(pools)
+        assert open_pool_ids(size) == {cpp_id for cpp_id, cpp in pools.items() if cpp["total_ram"] < size}
+        assert len(b.OPEN_BUNDLED_POOLS[size]) == len(open_pool_ids(size))
+        for cpp in pools.values():
+            assert cpp["total_ram"] == sum(c.ram_contributed for c in cpp["contributors"])
+            remaining = size - cpp["total_ram"]
+            if remaining > 0:
+                assert cpp["cpp_id"] in b.OPEN_BUNDLED_POOLS[size]._buckets[remaining]
+
+
+def test_capacity_stats_check_reports_drift():
+    node_id = b.register_agent(b.RegisterRequest(wallet="w", gpus=[gpu(0, 24)]))["node_id"]
+    b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0, 24)], cpp_type="bundled", target_ram=100))
+    assert b.check_capacity_stats() == {}
+    b.CAPACITY_STATS.bundled[100]["ram_gb"] += 1
+    assert set(b.check_capacity_stats()) == {"bundled", "total_ram_gb"}
@@ -0,0 +1,77 @@
+import backend_api as b
+
+
+def gpu(index, memory_gb=24, uuid=None):
+    return b.GPUInfo(index=index, name="A", memory_gb=memory_gb, frequency="1", percent="100", uuid=uuid)
+
+
+def register(wallet, gpus, **kwargs):
+    return b.register_agent(b.RegisterRequest(wallet=wallet, gpus=gpus, **kwargs))
+
+
+def test_reregistration_by_node_id_updates_in_place():
+    first = register("w1", [gpu(0)])
+    again = register("w2", [gpu(0), gpu(1)], node_id=first["node_id"])
+    assert again == {"node_id": first["node_id"], "status": "updated"}
+    assert len(b.NODES) == 1
+    assert len(b.NODES[first["node_id"]]["gpus"]) == 2
+    assert b.NODES_BY_WALLET == {"w2": [first["node_id"]]}
+    # An unknown node_id (e.g. after the registry was wiped) registers a new node
+    assert register("w2", [gpu(0)], node_id="gone")["status"] == "registered"
+
+
+def test_fleet_hosts_without_host_identity_stay_separate_nodes():
+    # Same wallet, identical hardware, nothing unique to the host
+    first = register("fleet", [gpu(0), gpu(1)])
+    second = register("fleet", [gpu(0), gpu(1)])
+    assert first["node_id"] != second["node_id"]
+    assert second["status"] == "registered"
+    assert b.NODES_BY_FINGERPRINT == {}
+    # GPU UUIDs on only some of the GPUs are not enough either
+    assert register("fleet", [gpu(0, uuid="GPU-1"), gpu(1)])["status"] == "registered"
+
+
+def test_hosts_are_matched_by_machine_id_or_gpu_uuids():
+    host_a = register("fleet", [gpu(0)], machine_id="host-a")
+    host_b = register("fleet", [gpu(0)], machine_id="host-b")
+    assert host_a["node_id"] != host_b["node_id"]
+    assert register("fleet", [gpu(0)], machine_id="host-a") == {"node_id": host_a["node_id"], "status": "updated"}
+
+    by_uuid = register("fleet", [gpu(0, uuid="GPU-1"), gpu(1, uuid="GPU-2")])
+    assert register("fleet", [gpu(1, uuid="GPU-2"), gpu(0, uuid="GPU-1")])["node_id"] == by_uuid["node_id"]
+    assert register("fleet", [gpu(0, uuid="GPU-3"), gpu(1, uuid="GPU-2")])["node_id"] != by_uuid["node_id"]
+    # Another wallet on the same host is another node
+    assert register("other", [gpu(0)], machine_id="host-a")["node_id"] != host_a["node_id"]
+    assert len(b.NODES) == 5
+
+
+def test_repeated_create_cpp_is_a_no_op():
+    node_id = register("w", [gpu(0), gpu(1, 13)])["node_id"]
+    request = b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0), gpu(1, 13)], cpp_type="isolated")
+    created = b.create_cpp(request)
+    version = b.REGISTRY_VERSION
+    assert b.create_cpp(request) == dict(created, status="isolated_cpp_unchanged")
+    assert b.REGISTRY_VERSION == version
+
+    bundled = b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0)], cpp_type="bundled", target_ram=100)
+    joined = b.create_cpp(bundled)
+    assert set(b.CPPS) == {joined["cpp_id"]}
+    again = b.create_cpp(bundled)
+    assert again == dict(joined, status="bundled_cpp_unchanged")
+
+
+def test_create_cpp_replaces_the_nodes_earlier_pools():
+    node_id = register("w", [gpu(0), gpu(1, 13)])["node_id"]
+    isolated = b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0), gpu(1, 13)], cpp_type="isolated"))
+    assert b.CONTRIBUTIONS == {node_id: 37}
+
+    replaced = b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[gpu(0)], cpp_type="isolated"))
+    assert replaced["status"] == "isolated_cpp_created"
+    assert not set(isolated["cpp_ids"]) & set(b.CPPS)
+    assert set(b.CPPS) == set(replaced["cpp_ids"])
+    assert b.CONTRIBUTIONS == {node_id: 24}
+
+    bundled = b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[gpu(1, 13)], cpp_type="bundled", target_ram=100))
+    assert set(b.CPPS) == {bundled["cpp_id"]}
+    assert b.CONTRIBUTIONS == {node_id: 13}
+    assert b.check_contributions() == {}
@@ -0,0 +1,107 @@
+import json
+import os
+
+import backend_api as b
+from registry_store import LOG_FILE, ROTATED_LOG_FILE, RegistryStore
+
+
+def gpu(index, memory_gb):
+    return b.GPUInfo(index=index, name="A", memory_gb=memory_gb, frequency="1", percent="100")
+
+
+def registry_state():
+    return json.dumps({"nodes": b.NODES, "cpps": b.CPPS}, default=b._json_default, sort_keys=True)
+
+
+def populate(count, start=0):
+    gpus = [gpu(0, 7), gpu(1, 24)]
+    for i in range(start, start + count):
+        node_id = b.register_agent(b.RegisterRequest(wallet=f"w{i % 5}", gpus=gpus))["node_id"]
+        b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=gpus[:1 + i % 2], cpp_type="bundled", target_ram=100))
+        if i % 3 == 0:
+            b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=gpus[:1], cpp_type="isolated"))
+
+
+def crash():
+    """Detach the store the way a killed process would: no final snapshot."""
+    thread, stop = b._SNAPSHOTTER
+    stop.set()
+    b._SNAPSHOT_WANTED.set()
+    thread.join()
+    b.STORE.close()
+    b.STORE = None
+    b._SNAPSHOTTER = None
+
+
+def test_recovers_from_snapshot_and_log_tail(tmp_path):
+    b.open_registry(str(tmp_path))
+    populate(30)
+    b._snapshot(force=True)
+    populate(20, start=30)
+    expected = registry_state()
+    crash()
+    assert os.path.getsize(tmp_path / LOG_FILE) > 0
+
+    b._reset_registry({}, {})
+    b.open_registry(str(tmp_path))
+    assert registry_state() == expected
+    assert b.check_contributions() == {}
+
+
+def test_background_snapshots_keep_every_record(tmp_path):
+    b.open_registry(str(tmp_path), snapshot_every=25)
+    populate(100)
+    expected = registry_state()
+    crash()
+    assert os.path.exists(tmp_path / "registry_snapshot.json")
+
+    b._reset_registry({}, {})
+    b.open_registry(str(tmp_path))
+    assert registry_state() == expected
+    assert b.check_contributions() == {}
+
+
+def test_load_truncates_torn_final_line(tmp_path):
+    store = RegistryStore(str(tmp_path))
+    store.load()
+    store.append([{"op": "a"}, {"op": "b"}])
+    store.close()
+    with open(tmp_path / LOG_FILE, "a") as f:
+        f.write('{"op": "c", "se')
+
+    store = RegistryStore(str(tmp_path))
+    state, records = store.load()
+    assert state is None
+    assert [(r["op"], r["seq"]) for r in records] == [("a", 1), ("b", 2)]
+    store.append([{"op": "d"}])
+    store.close()
+
+    state, records = RegistryStore(str(tmp_path)).load()
+    assert [(r["op"], r["seq"]) for r in records] == [("a", 1), ("b", 2), ("d", 3)]
+
+
+def test_load_replays_log_of_unfinished_snapshot(tmp_path):
+    store = RegistryStore(str(tmp_path))
+    store.load()
+    store.append([{"op": "a"}])
+    assert store.begin_snapshot() == 1
+    store.append([{"op": "b"}])
+    # Never written: the next one sets the log aside after the first
+    assert store.begin_snapshot() == 2
+    store.append([{"op": "c"}])
+    store.close()
+    assert os.path.exists(tmp_path / ROTATED_LOG_FILE)
+
+    store = RegistryStore(str(tmp_path))
+    state, records = store.load()
+    assert state is None
+    assert [r["op"] for r in records] == ["a", "b", "c"]
+    assert not os.path.exists(tmp_path / ROTATED_LOG_FILE)
+    seq = store.begin_snapshot()
+    store.append([{"op": "d"}])
+    store.write_snapshot({"ops": "abc"}, seq)
+    store.close()
+
+    state, records = RegistryStore(str(tmp_path)).load()
+    assert state == {"ops": "abc", "seq": 3}
+    assert [(r["op"], r["seq"]) for r in records] == [("d", 4)]
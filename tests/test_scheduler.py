@@ -0,0 +1,78 @@
+import pytest
+
+from scheduler import Scheduler
+
+
+def make_scheduler(pools):
+    scheduler = Scheduler(clock=lambda: 0.0)
+    for cpp_id, (cpp_type, capacity) in pools.items():
+        scheduler.set_capacity(cpp_id, cpp_type, capacity)
+    return scheduler
+
+
+def test_jobs_go_to_the_tightest_fitting_pool():
+    scheduler = make_scheduler({"small": ("isolated", 24), "medium": ("isolated", 48), "big": ("bundled", 200)})
+    assert scheduler.submit(20).cpp_id == "small"
+    assert scheduler.submit(30).cpp_id == "medium"
+    assert scheduler.submit(10).cpp_id == "medium"
+    assert scheduler.submit(10, cpp_type="bundled").cpp_id == "big"
+    assert scheduler.submit(60).cpp_id == "big"
+    assert scheduler.stats()["used_gb"] == 130
+
+
+def test_owners_take_turns_and_priority_goes_first():
+    scheduler = make_scheduler({"pool": ("isolated", 10)})
+    first = scheduler.submit(10, owner="a")  # takes the only slot
+    queued = [scheduler.submit(10, owner="a"), scheduler.submit(10, owner="a"), scheduler.submit(10, owner="b")]
+    urgent = scheduler.submit(10, owner="c", priority=1)
+    assert [job.state for job in [first] + queued + [urgent]] == ["running", "queued", "queued", "queued", "queued"]
+
+    order = []
+    for now in range(1, 5):
+        scheduler.complete_due(now=now * 60.0)
+        started = scheduler.schedule(now=now * 60.0)
+        order.extend(job.job_id for job in started)
+    # Higher priority first; then owner b gets its turn before owner a's second job
+    assert order == [urgent.job_id, queued[0].job_id, queued[2].job_id, queued[1].job_id]
+
+
+def test_shrinking_a_pool_preempts_the_newest_jobs():
+    scheduler = make_scheduler({"pool": ("isolated", 30)})
+    jobs = [scheduler.submit(10, now=float(t)) for t in range(3)]
+    scheduler.set_capacity("pool", "isolated", 15)
+    assert [job.state for job in jobs] == ["running", "queued", "queued"]
+    assert scheduler.preempted == 2
+    # Preempted jobs go back to the front of the queue, oldest first
+    scheduler.set_capacity("pool", "isolated", 30)
+    scheduler.schedule()
+    assert [job.state for job in jobs] == ["running", "running", "running"]
+
+    scheduler.retain_pools(set())
+    assert all(job.state == "queued" for job in jobs)
+    assert scheduler.stats()["pools"] == 0
+
+
+def test_a_job_that_does_not_fit_does_not_block_its_owner():
+    scheduler = make_scheduler({"pool": ("isolated", 50), "other": ("bundled", 1000)})
+    big = scheduler.submit(900, owner="x")  # takes most of "other"
+    blocked = scheduler.submit(200, owner="a")
+    small_a = scheduler.submit(10, owner="a")
+    small_b = scheduler.submit(10, owner="b")
+    assert [big.state, blocked.state, small_a.state, small_b.state] == ["running", "queued", "running", "running"]
+
+    scheduler.complete_due(now=big.duration_s)
+    scheduler.schedule(now=big.duration_s)
+    assert blocked.state == "running"
+
+
+def test_jobs_bigger_than_every_pool_are_refused():
+    scheduler = make_scheduler({"pool": ("isolated", 50)})
+    with pytest.raises(ValueError):
+        scheduler.submit(1000, owner="a")
+    with pytest.raises(ValueError):
+        scheduler.submit(10, cpp_type="bundled")
+    assert scheduler.submit(10, owner="a").state == "running"
+    assert scheduler.submit(10, owner="b").state == "running"
+    assert scheduler.stats()["queued"] == 0
+    with pytest.raises(ValueError):
+        Scheduler().submit(1)
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import multiprocessing
+import random
+import threading
+
+import backend_api as b
+
+WORKERS = 4
+
+
+def registry_digest():
+    pools = {cpp_id: [cpp["total_ram"], [c.to_row() for c in cpp["contributors"]]] for cpp_id, cpp in b.CPPS.items()}
+    text = json.dumps({"nodes": b.NODES, "cpps": pools}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def worker(data_dir, worker_id, barrier, results):
+    b.open_registry(data_dir, snapshot_every=50, shared=True)
+    gpus = [b.GPUInfo(index=i, name="A", memory_gb=m, frequency="1", percent="100") for i, m in enumerate([7, 13, 24])]
+    nodes = [b.register_agent(b.RegisterRequest(wallet=f"w{worker_id}-{i}", gpus=gpus))["node_id"] for i in range(10)]
+
+    def work(seed):
+        rng = random.Random(seed)
+        for _ in range(40):
+            node_id = rng.choice(nodes)
+            if rng.random() < 0.1:
+                b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=[rng.choice(gpus)], cpp_type="isolated"))
+            else:
+                b.create_cpp(b.CPPCreateRequest(node_id=node_id, gpus=gpus[:rng.randint(1, 3)], cpp_type="bundled",
+                                                target_ram=rng.choice([100, 200])))
+
+    threads = [threading.Thread(target=work, args=(worker_id * 10 + t,)) for t in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    barrier.wait()
+    # Every worker has finished writing; catching up must converge on one registry
+    b._catch_up()
+    results.put((worker_id, registry_digest(), b.check_contributions(), b.check_capacity_stats()))
+    barrier.wait()
+    b.close_registry()
+
+
+def test_workers_sharing_a_store_converge(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(WORKERS, timeout=120)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(str(tmp_path), w, barrier, results)) for w in range(WORKERS)]
+    for process in processes:
+        process.start()
+    reports = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join(timeout=120)
+    assert [process.exitcode for process in processes] == [0] * WORKERS
+
+    assert all(ledger == {} and stats == {} for _, _, ledger, stats in reports)
+    digests = {digest for _, digest, _, _ in reports}
+    assert len(digests) == 1
+
+    b.open_registry(str(tmp_path), shared=True)
+    assert {registry_digest()} == digests
+    assert len(b.NODES) == WORKERS * 10
+    assert b.check_contributions() == {}
+    assert b.check_capacity_stats() == {}
+    for size, open_pools in b.OPEN_BUNDLED_POOLS.items():
+        pools = [cpp for cpp in b.CPPS.values() if cpp["target_ram"] == size]
+        assert b.BUNDLED_POOL_COUNTS[size] == len(pools)
+        assert len(open_pools) == sum(1 for cpp in pools if cpp["total_ram"] < size)